@@ -0,0 +1,319 @@
+"""
+Нагрузочные сценарии бота без Telegram и MyMemory.
+
+Bot API заменяется записывающей заглушкой в процессе (BaseRequest), API перевода -
+локальным aiohttp сервером с настраиваемой задержкой и долей ошибок. Обновления
+подаются прямо в Application из main.build_application() тем же путем, что и у
+встроенного получателя обновлений (update_processor).
+
+Каждый сценарий выполняется в отдельном процессе, результат - JSON с p50/p95/p99,
+пропускной способностью и пиковым RSS:
+    python benchmark.py [start_burst more_words translate daily] [--out bench.json]
+        [--users 1000] [--daily-users 100000] [--latency-ms 50] [--error-rate 0.0]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+SCENARIOS = ('start_burst', 'more_words', 'translate', 'daily')
+# Сценарии, которые подают обновления через KeyedUpdateProcessor
+UPDATE_SCENARIOS = ('start_burst', 'more_words', 'translate')
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(q / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+def summarize(name: str, latencies: List[float], duration: float, extra: Optional[Dict] = None) -> Dict[str, Any]:
+    result = {
+        'scenario': name,
+        'operations': len(latencies),
+        'duration_s': round(duration, 3),
+        'throughput_ops_s': round(len(latencies) / duration, 1) if duration else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        # ru_maxrss в Linux - килобайты
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+    result.update(extra or {})
+    return result
+
+
+def _setup_environment(args: argparse.Namespace, translator_url: str):
+    """Конфигурация main до импорта: без дисков, без собранного словаря, локальный переводчик"""
+    os.environ.update({
+        'TELEGRAM_BOT_TOKEN': '123456:BENCHMARK',
+        'USER_STORE_BACKEND': 'memory',
+        'TRANSLATION_CACHE_DB': '',
+        'WORD_BANK_ARTIFACT': '',
+        'TRANSLATION_API_URL': translator_url,
+        # Рассылка упирается в заглушку, а не в лимиты Telegram
+        'BROADCAST_RATE': str(args.broadcast_rate),
+        # Раунды more_words нажимают ту же кнопку подряд: окно отсечения повторов
+        # оставило бы только первый раунд, и замер показал бы debouncer, а не обработчик
+        'CALLBACK_DEBOUNCE_WINDOW': '0',
+        # Суточный бюджет MyMemory в 5000 символов кончился бы посреди замера, и отказы
+        # квоты выглядели бы как быстрые ответы; заглушка переводчика квот не имеет
+        'TRANSLATION_DAILY_CHARS': str(10 ** 12),
+    })
+
+
+async def start_translator(latency_ms: float, error_rate: float, seed: int):
+    """Локальная замена MyMemory: GET /get?q=...&langpair=..."""
+    from aiohttp import web
+
+    rng = random.Random(seed)
+    stats = {'requests': 0, 'errors': 0}
+
+    async def handle(request: web.Request) -> web.Response:
+        stats['requests'] += 1
+        if latency_ms:
+            await asyncio.sleep(rng.expovariate(1 / latency_ms) / 1000)
+        if rng.random() < error_rate:
+            stats['errors'] += 1
+            return web.Response(status=500)
+        # Как MyMemory, строки текста переводятся по отдельности
+        text = '\n'.join(f"перевод:{line}" for line in request.query.get('q', '').split('\n'))
+        return web.json_response({
+            'responseData': {'translatedText': text},
+            'responseStatus': 200
+        })
+
+    app = web.Application()
+    app.router.add_get('/get', handle)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/get", stats
+
+
+def make_fake_request_class():
+    from telegram.request import BaseRequest
+
+    class FakeBotAPI(BaseRequest):
+        """Заглушка Bot API: записывает вызовы и отвечает правдоподобными объектами"""
+
+        def __init__(self):
+            self.calls: Dict[str, int] = {}
+            self.sent_at: List[float] = []
+            self._message_ids = itertools.count(1)
+
+        @property
+        def read_timeout(self) -> Optional[float]:
+            return None
+
+        async def initialize(self):
+            pass
+
+        async def shutdown(self):
+            pass
+
+        async def do_request(self, url: str, method: str, request_data=None, read_timeout=None,
+                             write_timeout=None, connect_timeout=None, pool_timeout=None) -> Tuple[int, bytes]:
+            api_method = url.rsplit('/', 1)[-1]
+            self.calls[api_method] = self.calls.get(api_method, 0) + 1
+            params = request_data.parameters if request_data else {}
+
+            if api_method == 'getMe':
+                result: Any = {'id': 1, 'is_bot': True, 'first_name': 'Bench', 'username': 'bench_bot'}
+            elif api_method in ('sendMessage', 'editMessageText'):
+                if api_method == 'sendMessage':
+                    self.sent_at.append(time.perf_counter())
+                result = {
+                    'message_id': params.get('message_id') or next(self._message_ids),
+                    'date': int(time.time()),
+                    'chat': {'id': params.get('chat_id', 0), 'type': 'private'},
+                    'text': params.get('text', '')
+                }
+            else:
+                result = True
+            return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+    return FakeBotAPI
+
+
+class UpdateFactory:
+    """Синтетические обновления Telegram"""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> Dict:
+        return {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"}
+
+    def _message(self, user_id: int, text: str) -> Dict:
+        message = {
+            'message_id': next(self._message_ids),
+            'date': int(time.time()),
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': self._user(user_id),
+            'text': text,
+        }
+        if text.startswith('/'):
+            message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return message
+
+    def message(self, user_id: int, text: str):
+        from telegram import Update
+        return Update.de_json({'update_id': next(self._update_ids), 'message': self._message(user_id, text)}, self.bot)
+
+    def callback(self, user_id: int, data: str):
+        from telegram import Update
+        return Update.de_json({
+            'update_id': next(self._update_ids),
+            'callback_query': {
+                'id': str(next(self._update_ids)),
+                'from': self._user(user_id),
+                'chat_instance': str(user_id),
+                'message': self._message(user_id, "words"),
+                'data': data,
+            }
+        }, self.bot)
+
+
+async def feed(application, updates: List, latencies: List[float]):
+    """Подача обновлений тем же путем, что и у встроенного получателя обновлений"""
+    async def one(update):
+        started = time.perf_counter()
+        await application.update_processor.process_update(update, application.process_update(update))
+        latencies.append(time.perf_counter() - started)
+
+    await asyncio.gather(*(one(update) for update in updates))
+
+
+async def run_scenario(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    translator, url, translator_stats = await start_translator(args.latency_ms, args.error_rate, args.seed)
+    _setup_environment(args, url)
+    random.seed(args.seed)
+
+    import main
+
+    fake_api = make_fake_request_class()()
+    application = main.build_application(request=fake_api)
+    await application.initialize()
+    await main.on_startup(application)
+    await application.start()
+    factory = UpdateFactory(application.bot)
+    levels = ('A1', 'A2', 'B1', 'B2', 'C1', 'C2')
+    latencies: List[float] = []
+    extra: Dict[str, Any] = {}
+
+    started = time.perf_counter()
+    try:
+        if name == 'start_burst':
+            users = range(1, args.users + 1)
+            await feed(application, [factory.message(u, '/start') for u in users], latencies)
+            await feed(application, [factory.callback(u, f"level_{random.choice(levels)}") for u in users], latencies)
+
+        elif name == 'more_words':
+            users = range(1, args.users + 1)
+            for user_id in users:
+                main.bot.get_user_data(user_id).level = random.choice(levels)
+            for _ in range(args.clicks):
+                await feed(application, [factory.callback(u, 'more_words') for u in users], latencies)
+
+        elif name == 'translate':
+            words = [w for level_words in main.bot.level_word_bank.values() for w in level_words]
+            phrases = ["how are you", "good morning", "привет", "кошка", "see you later"]
+            updates = [
+                factory.message(u, random.choice(words) if random.random() < 0.8 else random.choice(phrases))
+                for u in range(1, args.users + 1)
+            ]
+            await feed(application, updates, latencies)
+
+        elif name == 'daily':
+            for user_id in range(1, args.daily_users + 1):
+                user = main.bot.get_user_data(user_id)
+                user.level = levels[user_id % len(levels)]
+            started = time.perf_counter()
+            context = type('BenchContext', (), {'bot': application.bot})()
+            await main.daily_words_job(context)
+            # Задержка доставки каждого сообщения от старта рассылки
+            latencies = [sent - started for sent in fake_api.sent_at]
+            extra['broadcast'] = main.last_broadcaster.stats.as_dict() if main.last_broadcaster else {}
+
+        else:
+            raise SystemExit(f"Неизвестный сценарий {name}")
+
+        duration = time.perf_counter() - started
+    finally:
+        await application.stop()
+        await main.on_shutdown(application)
+        await application.shutdown()
+        await translator.cleanup()
+
+    extra['bot_api_calls'] = fake_api.calls
+    # Отброшенные повторные нажатия входят в operations, но обработчик не выполняли
+    debouncer = application.update_processor.debouncer
+    if debouncer is not None and name in UPDATE_SCENARIOS:
+        extra['debounced'] = dict(debouncer.dropped)
+        extra['handled'] = len(latencies) - sum(debouncer.dropped.values())
+    extra['translator'] = translator_stats
+    return summarize(name, latencies, duration, extra)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Нагрузочные сценарии бота")
+    parser.add_argument('scenarios', nargs='*', default=list(SCENARIOS), help=f"сценарии: {', '.join(SCENARIOS)}")
+    parser.add_argument('--users', type=int, default=1000, help="пользователей в интерактивных сценариях")
+    parser.add_argument('--clicks', type=int, default=3, help="нажатий 'еще слова' на пользователя")
+    parser.add_argument('--daily-users', type=int, default=100000, help="подписчиков в сценарии daily")
+    parser.add_argument('--latency-ms', type=float, default=50.0, help="средняя задержка API перевода")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля ответов 500 от API перевода")
+    parser.add_argument('--broadcast-rate', type=float, default=1e6, help="BROADCAST_RATE для рассылки")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', help="файл для JSON результатов")
+    parser.add_argument('--run-one', help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    if args.run_one:
+        import logging
+        logging.disable(logging.WARNING)
+        print(json.dumps(asyncio.run(run_scenario(args.run_one, args))))
+        return
+
+    # Каждый сценарий в отдельном процессе: чистое состояние и честный пиковый RSS
+    passthrough = [
+        '--users', str(args.users), '--clicks', str(args.clicks), '--daily-users', str(args.daily_users),
+        '--latency-ms', str(args.latency_ms), '--error-rate', str(args.error_rate),
+        '--broadcast-rate', str(args.broadcast_rate), '--seed', str(args.seed),
+    ]
+    results = []
+    for name in args.scenarios:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--run-one', name, *passthrough],
+            check=True, capture_output=True, text=True
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+
+    report = json.dumps({'results': results}, indent=2, ensure_ascii=False)
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            f.write(report)
+    print(report)
+
+
+if __name__ == '__main__':
+    main()
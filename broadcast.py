@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import random
+import time
+from dataclasses import dataclass, asdict
+from typing import Any, AsyncIterable, Awaitable, Callable, Dict, Iterable, Optional, Union
+
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, NetworkError, RetryAfter
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Ограничитель скорости: rate токенов в секунду, не больше capacity подряд"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        """Остановить выдачу токенов (например, после RetryAfter от Telegram)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+@dataclass
+class BroadcastStats:
+    """Итоги рассылки"""
+    total: int = 0
+    sent: int = 0
+    failed: int = 0
+    blocked: int = 0
+    skipped: int = 0
+    retries: int = 0
+    duration: float = 0.0
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.failed + self.blocked + self.skipped
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data['duration'] = round(self.duration, 2)
+        return data
+
+
+# Функция подготовки сообщения: kwargs для send_message или None, если отправлять не нужно
+RenderFunc = Callable[[int], Awaitable[Optional[Dict[str, Any]]]]
+# Вызывается после обработки чата: id чата и доставлено ли сообщение
+DoneFunc = Callable[[int, bool], None]
+
+
+class Broadcaster:
+    """
+    Массовая рассылка с пулом воркеров и ограничением скорости.
+
+    Глобальный лимит Telegram ~30 сообщений в секунду, в один чат - не чаще
+    раза в секунду. RetryAfter приостанавливает всю рассылку на указанное время,
+    сетевые ошибки повторяются с экспоненциальной задержкой и джиттером.
+    """
+
+    def __init__(self, bot: Bot, workers: int = 16, rate: float = 25.0,
+                 per_chat_interval: float = 1.0, max_retries: int = 3,
+                 progress_every: int = 1000):
+        self.bot = bot
+        self.workers = workers
+        self.bucket = TokenBucket(rate)
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self.progress_every = progress_every
+        self.stats = BroadcastStats()
+        self._last_sent: Dict[int, float] = {}
+
+    async def run(self, chat_ids: Union[Iterable[int], AsyncIterable[int]], render: RenderFunc,
+                  total: Optional[int] = None, on_done: Optional[DoneFunc] = None) -> BroadcastStats:
+        """
+        Рассылка по списку чатов; chat_ids должен быть снимком, а не живой коллекцией,
+        или асинхронным потоком (total - его длина для прогресса). Очередь ограничена,
+        поэтому поток читается по мере отправки. on_done вызывается для каждого чата
+        после отправки, пропуска или ошибки.
+        """
+        streamed = hasattr(chat_ids, '__aiter__')
+        if not streamed:
+            chat_ids = list(chat_ids)
+            total = len(chat_ids)
+        self.stats = BroadcastStats(total=total or 0)
+        started = time.monotonic()
+
+        workers_count = max(1, self.workers)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=workers_count * 4)
+        workers = [asyncio.create_task(self._worker(queue, render, on_done)) for _ in range(workers_count)]
+        try:
+            if streamed:
+                async for chat_id in chat_ids:
+                    await queue.put(chat_id)
+            else:
+                for chat_id in chat_ids:
+                    await queue.put(chat_id)
+            await queue.join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+        self.stats.duration = time.monotonic() - started
+        logger.info(f"Рассылка завершена: {self.stats.as_dict()}")
+        return self.stats
+
+    async def _worker(self, queue: asyncio.Queue, render: RenderFunc, on_done: Optional[DoneFunc]):
+        while True:
+            chat_id = await queue.get()
+            sent = False
+            try:
+                sent = await self._deliver(chat_id, render)
+            except Exception as e:
+                self.stats.failed += 1
+                logger.error(f"Ошибка отправки пользователю {chat_id}: {e}")
+            finally:
+                if on_done is not None:
+                    try:
+                        on_done(chat_id, sent)
+                    except Exception as e:
+                        logger.error(f"Ошибка завершения отправки пользователю {chat_id}: {e}")
+                queue.task_done()
+                processed = self.stats.processed
+                if self.progress_every and processed % self.progress_every == 0:
+                    logger.info(f"Рассылка: {processed}/{self.stats.total}")
+
+    async def _deliver(self, chat_id: int, render: RenderFunc) -> bool:
+        """Отправка сообщения чату; True, если оно доставлено"""
+        payload = await render(chat_id)
+        if payload is None:
+            self.stats.skipped += 1
+            return False
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.stats.retries += 1
+            await self._wait_for_chat(chat_id)
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(chat_id=chat_id, **payload)
+                self._last_sent[chat_id] = time.monotonic()
+                self.stats.sent += 1
+                return True
+            except RetryAfter as e:
+                logger.warning(f"Telegram просит подождать {e.retry_after} с")
+                self.bucket.pause(e.retry_after)
+            except Forbidden:
+                # Пользователь заблокировал бота - повторять бессмысленно
+                self.stats.blocked += 1
+                return False
+            except BadRequest as e:
+                self.stats.failed += 1
+                logger.error(f"Ошибка отправки пользователю {chat_id}: {e}")
+                return False
+            except NetworkError as e:
+                logger.warning(f"Сетевая ошибка при отправке пользователю {chat_id}: {e}")
+                if attempt < self.max_retries:
+                    await asyncio.sleep(min(30.0, 2 ** attempt) * random.uniform(0.5, 1.5))
+
+        self.stats.failed += 1
+        logger.error(f"Не удалось отправить сообщение пользователю {chat_id} после {self.max_retries + 1} попыток")
+        return False
+
+    async def _wait_for_chat(self, chat_id: int):
+        """Ограничение частоты сообщений в один чат"""
+        last = self._last_sent.get(chat_id)
+        if last is not None:
+            delay = self.per_chat_interval - (time.monotonic() - last)
+            if delay > 0:
+                await asyncio.sleep(delay)
@@ -0,0 +1,145 @@
+"""
+Поиск слов с опечатками методом симметричного удаления (SymSpell).
+
+Для каждого слова заранее сохраняются все варианты его префикса с удалением до
+max_distance символов; запрос порождает такие же удаления и находит кандидатов
+прямым поиском в dict, а точное расстояние проверяется только для них. Префикс
+ограничивает число удалений на слово, поэтому индекс строится за доли секунды и
+для словаря в десятки тысяч слов; цена - редкие пропуски длинных слов, у которых
+обе правки сдвигают префикс.
+"""
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Расстояние Дамерау-Левенштейна (вариант с ограниченными перестановками);
+    max_distance + 1, если расстояние больше max_distance.
+    Считается только полоса |i - j| <= max_distance матрицы.
+    """
+    if a == b:
+        return 0
+    len_a, len_b = len(a), len(b)
+    if abs(len_a - len_b) > max_distance:
+        return max_distance + 1
+    limit = max_distance + 1
+    previous_previous: List[int] = []
+    previous = [j if j <= max_distance else limit for j in range(len_b + 1)]
+    for i in range(1, len_a + 1):
+        char_a = a[i - 1]
+        current = [limit] * (len_b + 1)
+        if i <= max_distance:
+            current[0] = i
+        row_min = current[0]
+        for j in range(max(1, i - max_distance), min(len_b, i + max_distance) + 1):
+            char_b = b[j - 1]
+            value = previous[j - 1] + (char_a != char_b)
+            if previous[j] + 1 < value:
+                value = previous[j] + 1
+            if current[j - 1] + 1 < value:
+                value = current[j - 1] + 1
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b and previous_previous[j - 2] + 1 < value:
+                value = previous_previous[j - 2] + 1
+            if value > limit:
+                value = limit
+            current[j] = value
+            if value < row_min:
+                row_min = value
+        if row_min >= limit:
+            return limit
+        previous_previous, previous = previous, current
+    return previous[len_b]
+
+
+class SymSpellIndex:
+    """Индекс слов для поиска ближайших по расстоянию редактирования не больше max_distance"""
+
+    def __init__(self, max_distance: int = 2, prefix_length: int = 7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.words: List[str] = []
+        self._ids: Dict[str, int] = {}
+        # Удаление -> id слова, а при совпадении удалений у нескольких слов - список id
+        self._deletes: Dict[str, Union[int, List[int]]] = {}
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._ids
+
+    def _deletions(self, word: str) -> Set[str]:
+        """Все варианты префикса слова с удалением от 0 до max_distance символов"""
+        result = {word[:self.prefix_length]}
+        frontier = result
+        for _ in range(self.max_distance):
+            frontier = {
+                variant[:position] + variant[position + 1:]
+                for variant in frontier if len(variant) > 1
+                for position in range(len(variant))
+            }
+            result |= frontier
+        return result
+
+    def add(self, word: str):
+        if not word or word in self._ids:
+            return
+        word_id = len(self.words)
+        self.words.append(word)
+        self._ids[word] = word_id
+        deletes = self._deletes
+        for variant in self._deletions(word):
+            existing = deletes.get(variant)
+            if existing is None:
+                deletes[variant] = word_id
+            elif isinstance(existing, int):
+                deletes[variant] = [existing, word_id]
+            else:
+                existing.append(word_id)
+
+    def extend(self, words: Iterable[str]):
+        for word in words:
+            self.add(word)
+
+    def _candidates(self, term: str) -> Set[int]:
+        candidates: Set[int] = set()
+        for variant in self._deletions(term):
+            found = self._deletes.get(variant)
+            if found is None:
+                continue
+            if isinstance(found, int):
+                candidates.add(found)
+            else:
+                candidates.update(found)
+        return candidates
+
+    def lookup(self, term: str, max_distance: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Слова на расстоянии не больше max_distance: по возрастанию расстояния, затем в порядке добавления"""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        if term in self._ids:
+            return [(term, 0)]
+
+        matches = []
+        for word_id in self._candidates(term):
+            word = self.words[word_id]
+            distance = edit_distance(term, word, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, word_id))
+        matches.sort()
+        return [(self.words[word_id], distance) for distance, word_id in matches]
+
+    def best(self, term: str, max_distance: Optional[int] = None) -> Optional[Tuple[str, int]]:
+        """Ближайшее слово и расстояние до него; среди равных - добавленное раньше"""
+        bound = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        if term in self._ids:
+            return term, 0
+
+        best_distance, best_id = bound + 1, -1
+        for word_id in self._candidates(term):
+            # Найденное расстояние сужает границу для остальных кандидатов
+            distance = edit_distance(term, self.words[word_id], best_distance)
+            if distance < best_distance or (distance == best_distance and word_id < best_id):
+                best_distance, best_id = distance, word_id
+        if best_id < 0 or best_distance > bound:
+            return None
+        return self.words[best_id], best_distance
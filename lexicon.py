@@ -0,0 +1,212 @@
+"""
+Двусторонний словарь en<->ru в памяти для ответа на отдельные слова без сети.
+
+Английские слова берутся из словаря CEFR с переводами из собранного артефакта,
+встроенного резервного словаря и полученных во время работы переводов; русский
+индекс строится обратным поиском по этим переводам. Формы слов сводятся к
+словарным простыми правилами (множественное число, времена, падежные окончания),
+опечатки исправляются по индексу SymSpell (fuzzy_index.py).
+"""
+import re
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from fuzzy_index import SymSpellIndex
+
+_PUNCTUATION = re.compile(r"^[\W_]+|[\W_]+$")
+_VARIANT_SEPARATORS = re.compile(r"[,;/]|\s+или\s+")
+
+# Неправильные формы, которые не сводятся правилами
+IRREGULAR_EN = {
+    'went': 'go', 'gone': 'go', 'was': 'be', 'were': 'be', 'been': 'be', 'is': 'be', 'are': 'be', 'am': 'be',
+    'had': 'have', 'has': 'have', 'did': 'do', 'done': 'do', 'does': 'do', 'made': 'make', 'said': 'say',
+    'took': 'take', 'taken': 'take', 'came': 'come', 'saw': 'see', 'seen': 'see', 'knew': 'know',
+    'known': 'know', 'got': 'get', 'gave': 'give', 'given': 'give', 'found': 'find', 'thought': 'think',
+    'told': 'tell', 'became': 'become', 'left': 'leave', 'felt': 'feel', 'brought': 'bring', 'began': 'begin',
+    'begun': 'begin', 'kept': 'keep', 'held': 'hold', 'wrote': 'write', 'written': 'write', 'stood': 'stand',
+    'heard': 'hear', 'meant': 'mean', 'met': 'meet', 'ran': 'run', 'paid': 'pay', 'sat': 'sit', 'spoke': 'speak',
+    'spoken': 'speak', 'lay': 'lie', 'led': 'lead', 'grew': 'grow', 'grown': 'grow', 'lost': 'lose',
+    'fell': 'fall', 'fallen': 'fall', 'sent': 'send', 'built': 'build', 'understood': 'understand',
+    'drew': 'draw', 'drawn': 'draw', 'broke': 'break', 'broken': 'break', 'spent': 'spend', 'rose': 'rise',
+    'drove': 'drive', 'driven': 'drive', 'bought': 'buy', 'wore': 'wear', 'worn': 'wear', 'chose': 'choose',
+    'chosen': 'choose', 'ate': 'eat', 'eaten': 'eat', 'taught': 'teach', 'caught': 'catch', 'slept': 'sleep',
+    'children': 'child', 'men': 'man', 'women': 'woman', 'people': 'person', 'feet': 'foot', 'teeth': 'tooth',
+    'mice': 'mouse', 'geese': 'goose', 'better': 'good', 'best': 'good', 'worse': 'bad', 'worst': 'bad',
+}
+
+# Однозначные трехбуквенные окончания и окончания словарной формы той же части речи.
+# Окончания из одной-двух букв не отсекаются: другой -> друг, едет -> еда дают чужие слова
+_RU_NOUN_LEMMAS = ('', 'а', 'я', 'ь', 'о', 'е', 'й')
+_RU_ADJECTIVE_LEMMAS = ('ый', 'ий', 'ой')
+_RU_VERB_LEMMAS = ('ать', 'ять', 'ить', 'еть', 'ти')
+_RU_ENDINGS = (
+    ('ами', _RU_NOUN_LEMMAS), ('ями', _RU_NOUN_LEMMAS),
+    ('ого', _RU_ADJECTIVE_LEMMAS), ('его', _RU_ADJECTIVE_LEMMAS), ('ому', _RU_ADJECTIVE_LEMMAS),
+    ('ему', _RU_ADJECTIVE_LEMMAS), ('ыми', _RU_ADJECTIVE_LEMMAS), ('ими', _RU_ADJECTIVE_LEMMAS),
+    ('ешь', _RU_VERB_LEMMAS), ('ишь', _RU_VERB_LEMMAS), ('ете', _RU_VERB_LEMMAS), ('ите', _RU_VERB_LEMMAS),
+)
+# Минимальная длина основы после отсечения окончания
+MIN_STEM = 3
+
+
+def normalize_word(text: str) -> str:
+    """Регистр, ё и знаки препинания по краям"""
+    return _PUNCTUATION.sub('', ' '.join(text.split()).casefold().replace('ё', 'е'))
+
+
+def english_lemmas(word: str) -> Iterator[str]:
+    """
+    Кандидаты словарной формы английского слова, начиная с самого слова. Отсекаются
+    только словоизменительные окончания: -er, -est, -ly образуют другие слова (finest, weekly).
+    """
+    yield word
+    if word in IRREGULAR_EN:
+        yield IRREGULAR_EN[word]
+    if word.endswith("'s"):
+        word = word[:-2]
+        yield word
+    if word.endswith('ies') and len(word) - 3 >= MIN_STEM:
+        yield word[:-3] + 'y'
+    if word.endswith('es') and len(word) - 2 >= MIN_STEM:
+        yield word[:-2]
+    if word.endswith('s') and not word.endswith('ss') and len(word) - 1 >= MIN_STEM:
+        yield word[:-1]
+    for suffix in ('ed', 'ing'):
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM:
+            stem = word[:-len(suffix)]
+            yield stem
+            yield stem + 'e'
+            if stem.endswith('i'):
+                yield stem[:-1] + 'y'
+            if stem[-1] == stem[-2]:
+                yield stem[:-1]
+
+
+def russian_lemmas(word: str) -> Iterator[str]:
+    """Кандидаты словарной формы русского слова, начиная с самого слова"""
+    yield word
+    for ending, lemma_endings in _RU_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            stem = word[:-len(ending)]
+            for lemma_ending in lemma_endings:
+                yield stem + lemma_ending
+
+
+# Источник перевода, найденного по предполагаемой словарной форме, а не по самому слову
+APPROXIMATE = 'approximate'
+
+
+class LexiconEntry(NamedTuple):
+    word: str
+    translation: str
+    source: str
+
+
+class Correction(NamedTuple):
+    word: str
+    distance: int
+    # Слово достаточно длинное, чтобы считать отличие опечаткой, а не другим словом,
+    # и на том же расстоянии нет других слов
+    confident: bool
+    # Все слова на том же расстоянии в порядке добавления (word - первое из них)
+    candidates: Tuple[str, ...] = ()
+
+    @property
+    def suggestion(self) -> str:
+        """Подсказка пользователю: слово или несколько равноудаленных вариантов"""
+        return ', '.join(self.candidates[:3]) if self.candidates else self.word
+
+
+class Lexicon:
+    """Индексы en->ru и ru->en; поиск только по отдельным словам и точным фразам"""
+
+    def __init__(self, max_distance: int = 2):
+        self._en: Dict[str, LexiconEntry] = {}
+        self._ru: Dict[str, List[str]] = {}
+        # Известные слова для исправления опечаток, в том числе еще без перевода
+        self.en_index = SymSpellIndex(max_distance)
+        self.ru_index = SymSpellIndex(max_distance)
+
+    def __len__(self) -> int:
+        return len(self._en)
+
+    def add(self, word: str, translation: str, source: str):
+        """Добавление перевода английского слова; уже известный перевод не заменяется"""
+        key = normalize_word(word)
+        if not key or not translation or key in self._en:
+            return
+        self._en[key] = LexiconEntry(word, translation, source)
+        self.en_index.add(key)
+        for variant in _VARIANT_SEPARATORS.split(translation):
+            variant = normalize_word(variant)
+            if not variant:
+                continue
+            if ' ' not in variant:
+                self.ru_index.add(variant)
+            english = self._ru.setdefault(variant, [])
+            if word not in english:
+                english.append(word)
+
+    def translation(self, word: str) -> Optional[str]:
+        """Известный перевод английского слова в словарной форме"""
+        entry = self._en.get(normalize_word(word))
+        return entry.translation if entry is not None else None
+
+    def reverse_items(self) -> Iterator[Tuple[str, List[str]]]:
+        """Русские варианты переводов и английские слова для них, в порядке добавления"""
+        return iter(self._ru.items())
+
+    def add_vocabulary(self, words: Iterable[str]):
+        """Английские слова, к которым исправляются опечатки, даже если перевод еще не известен"""
+        for word in words:
+            self.en_index.add(normalize_word(word))
+
+    def correct(self, text: str, source_lang: str) -> Optional[Correction]:
+        """Ближайшие известные слова для слова с опечаткой; None для фраз и неизвестных слов"""
+        key = normalize_word(text)
+        if len(key) < 3 or ' ' in key:
+            return None
+        index = self.en_index if source_lang == 'en' else self.ru_index
+        matches = index.lookup(key)
+        if not matches or matches[0][1] == 0:
+            return None
+        word, distance = matches[0]
+        candidates = tuple(candidate for candidate, candidate_distance in matches if candidate_distance == distance)
+        # В коротких словах одна-две правки чаще дают другое существующее слово; при
+        # нескольких равноудаленных словах (wather - water, father, weather) выбрать нельзя
+        confident = len(candidates) == 1 and (len(key) >= 5 if distance == 1 else len(key) >= 8)
+        return Correction(word, distance, confident, candidates)
+
+    def lookup(self, text: str, source_lang: str) -> Optional[LexiconEntry]:
+        """
+        Перевод слова или фразы из словаря; None, если нужен запрос к API. Перевод
+        по словарной форме - только для неизвестных слов и с источником APPROXIMATE.
+        """
+        key = normalize_word(text)
+        if not key:
+            return None
+        if source_lang == 'en':
+            entry = self._en.get(key)
+            if entry is not None or ' ' in key or key in self.en_index:
+                # Известное слово без перевода не подменяется похожим (weekly - не week)
+                return entry
+            for candidate in english_lemmas(key):
+                entry = self._en.get(candidate)
+                if entry is not None:
+                    return LexiconEntry(entry.word, entry.translation, APPROXIMATE)
+            return None
+
+        english = self._ru.get(key)
+        if english:
+            return self._russian_entry(key, english)
+        if ' ' in key or key in self.ru_index:
+            return None
+        for candidate in russian_lemmas(key):
+            english = self._ru.get(candidate)
+            if english:
+                return self._russian_entry(candidate, english, APPROXIMATE)
+        return None
+
+    def _russian_entry(self, word: str, english: List[str], source: Optional[str] = None) -> LexiconEntry:
+        # Слова добавляются по уровням от A1, первые - самые употребительные
+        translation = ', '.join(english[:3])
+        return LexiconEntry(word, translation, source or self._en[normalize_word(english[0])].source)
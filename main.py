@@ -1,19 +1,47 @@
 import asyncio
+import io
 import json
 import logging
 import os
 import random
-from datetime import datetime, time
-from typing import Dict, List, Optional, Set
+import signal
+import time as time_module
+from array import array
+from datetime import date, datetime, time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
 from dataclasses import dataclass, field
 
 import aiohttp
 import pytz
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram import (
+    InlineKeyboardButton, InlineKeyboardMarkup, InlineQueryResultArticle, InputTextMessageContent, Update
+)
+from telegram.request import BaseRequest, HTTPXRequest
 from telegram.ext import (
-    Application, CallbackQueryHandler, CommandHandler, ContextTypes,
-    MessageHandler, filters
+    Application, ApplicationHandlerStop, CallbackQueryHandler, CommandHandler, ContextTypes,
+    InlineQueryHandler, MessageHandler, TypeHandler, filters
+)
+
+from broadcast import Broadcaster
+from lexicon import APPROXIMATE, Lexicon, normalize_word
+from metrics import Registry, timed
+from prefix_index import PrefixIndex
+from profiling import UPSTREAM, LoopLagMonitor, Profiler, TracedRequest, record, traced
+from review import AGAIN, EASY, GOOD, HARD, DueQueue, ReviewDeck
+from server import BotServer
+from sharding import ShardRouter, Sharding, create_lease_store, instance_id, run_once
+from update_processor import CallbackDebouncer, KeyedUpdateProcessor
+from translation_cache import TranslationCache, normalize_text
+from translation_config import (
+    TRANSLATION_BACKGROUND_RESERVE, TRANSLATION_CACHE_DB, TRANSLATION_CACHE_SIZE, TRANSLATION_CACHE_TTL,
+    TRANSLATION_DAILY_CHARS, TRANSLATION_QUOTA_WINDOW, create_providers, create_session, langpair
 )
+from translation_providers import Backend, BatchingProvider, CircuitBreaker, HedgedTranslator, LocalProvider
+from translation_quota import BACKGROUND, PRIORITY_NAMES, TranslationQuota, translation_priority
+from user_store import UserRepository, create_user_store
+from word_index import WordIndex, WordSet
+from word_sampler import LEVELS, draw_unseen, level_position
+from word_bank import load_artifact
 
 # Конфигурация логирования
 logging.basicConfig(
@@ -25,27 +53,335 @@ logger = logging.getLogger(__name__)
 # Конфигурация
 TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 WORDS_FILE = 'words_cefr.json'
-TRANSLATION_TIMEOUT = 10  # секунд
+WORD_BANK_ARTIFACT = os.getenv('WORD_BANK_ARTIFACT', 'words_cefr.bin')
+# Хеджирование: если источник не ответил за свой p95, параллельно запрашивается следующий
+TRANSLATION_HEDGE = os.getenv('TRANSLATION_HEDGE', '1') == '1'
+TRANSLATION_HEDGE_MAX_DELAY = float(os.getenv('TRANSLATION_HEDGE_MAX_DELAY', '1.0'))  # секунд
+TRANSLATION_DEADLINE = float(os.getenv('TRANSLATION_DEADLINE', '3.0'))  # секунд на ответ пользователю
+TRANSLATION_BREAKER_OPEN = float(os.getenv('TRANSLATION_BREAKER_OPEN', '30'))  # секунд
 MAX_WORDS_PER_REQUEST = 10
+# Режим работы: 'polling' или 'webhook' (нужен WEBHOOK_URL - внешний адрес сервиса)
+BOT_MODE = os.getenv('BOT_MODE', 'polling')
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '')
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')
+PORT = int(os.getenv('PORT', '8080'))
+SHUTDOWN_TIMEOUT = float(os.getenv('SHUTDOWN_TIMEOUT', '25'))  # секунд на обработку оставшихся обновлений
+# Параллельная обработка обновлений разных пользователей; обновления одного пользователя - по порядку
+UPDATE_CONCURRENCY = int(os.getenv('UPDATE_CONCURRENCY', '32'))
+# Обновлений одного пользователя в очереди, сверх них новые отбрасываются
+UPDATE_MAX_PER_USER = int(os.getenv('UPDATE_MAX_PER_USER', '20'))
+# Кнопки, повторные нажатия которых схлопываются, и окно отсечения повторов
+CALLBACK_DEBOUNCE_DATA = os.getenv('CALLBACK_DEBOUNCE_DATA', 'more_words')
+CALLBACK_DEBOUNCE_WINDOW = float(os.getenv('CALLBACK_DEBOUNCE_WINDOW', '1.0'))  # секунд
+# Одновременные запросы отдельных слов объединяются в один запрос к API: размер пачки (1 - без объединения)
+# и сколько первое слово пачки ждет остальные
+TRANSLATION_BATCH_SIZE = int(os.getenv('TRANSLATION_BATCH_SIZE', '10'))
+TRANSLATION_BATCH_WINDOW = float(os.getenv('TRANSLATION_BATCH_WINDOW', '0.01'))  # секунд
+BROADCAST_WORKERS = int(os.getenv('BROADCAST_WORKERS', '16'))
+# Сообщений в секунду на всех шардах вместе: лимит Telegram ~30 действует на бота, а не на экземпляр
+BROADCAST_RATE = float(os.getenv('BROADCAST_RATE', '25'))
+BROADCAST_MAX_RETRIES = int(os.getenv('BROADCAST_MAX_RETRIES', '3'))
+# Подготовка ежедневных сообщений заранее (время UTC), повторный проход добирает ошибки
+DAILY_PREPARE_TIMES = os.getenv('DAILY_PREPARE_TIMES', '03:00,05:00')
+DAILY_PREPARE_BATCH = int(os.getenv('DAILY_PREPARE_BATCH', '200'))
+# Общая колода на уровень и день для утренней рассылки вместо отдельной колоды каждому
+DAILY_SHARED_DECKS = os.getenv('DAILY_SHARED_DECKS', '1') == '1'
+DAILY_DECK_COHORTS = max(1, int(os.getenv('DAILY_DECK_COHORTS', '1')))
+SHARED_DECK_SIZE = int(os.getenv('SHARED_DECK_SIZE', '15'))  # запас слов, чтобы пропускать изученные
+USER_STORE_BACKEND = os.getenv('USER_STORE_BACKEND', 'sqlite')  # 'sqlite' или 'memory'
+USER_STORE_DB = os.getenv('USER_STORE_DB', 'users.sqlite3')
+USER_STORE_FLUSH_INTERVAL = float(os.getenv('USER_STORE_FLUSH_INTERVAL', '2'))  # секунд
+USER_STORE_BATCH = int(os.getenv('USER_STORE_BATCH', '500'))
+# Память под данные активных пользователей; остальные читаются из хранилища по требованию (0 - без ограничения)
+USER_CACHE_MB = float(os.getenv('USER_CACHE_MB', '256'))
+USER_CACHE_MIN_IDLE = float(os.getenv('USER_CACHE_MIN_IDLE', '60'))  # секунд без обращений до вытеснения
+# Несколько экземпляров: пользователи делятся по хэшу user_id (см. sharding.py)
+SHARD_COUNT = int(os.getenv('SHARD_COUNT', '1'))
+SHARD_INDEX = int(os.getenv('SHARD_INDEX', '0'))
+# Внутренние адреса экземпляров по порядку шардов, через запятую
+SHARD_PEERS = [url.strip() for url in os.getenv('SHARD_PEERS', '').split(',') if url.strip()]
+JOB_LEASE_TTL = float(os.getenv('JOB_LEASE_TTL', '120'))  # секунд, аренда продлевается во время задачи
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') == '1'
+# Обработчики и переводы дольше порога пишутся в лог с разбивкой по времени (0 - не отслеживать)
+SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD', '1.0'))  # секунд
+# Замер задержки event loop: период проверки и задержка, о которой пишется в лог
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))  # секунд
+LOOP_LAG_THRESHOLD = float(os.getenv('LOOP_LAG_THRESHOLD', '0.1'))  # секунд
+PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', '120'))  # предел длительности /profile
+ACTIVE_USER_WINDOW = int(os.getenv('ACTIVE_USER_WINDOW', '3600'))  # секунд
+INLINE_CACHE_TIME = int(os.getenv('INLINE_CACHE_TIME', '300'))  # секунд кэширования inline-ответов в Telegram
+INLINE_RESULTS = int(os.getenv('INLINE_RESULTS', '20'))
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv('ADMIN_USER_IDS', '').split(',') if user_id.strip()}
 
-@dataclass
+# Метрики (эндпоинт /metrics HTTP сервера)
+metrics = Registry(enabled=METRICS_ENABLED)
+HANDLER_LATENCY = metrics.histogram(
+    'bot_handler_duration_seconds', 'Длительность обработчиков и задач', ('handler',)
+)
+HANDLER_ERRORS = metrics.counter(
+    'bot_handler_errors_total', 'Необработанные исключения в обработчиках', ('handler',)
+)
+TRANSLATION_LATENCY = metrics.histogram(
+    'bot_translation_upstream_duration_seconds', 'Длительность запросов к источникам перевода', ('provider',)
+)
+TRANSLATION_REQUESTS = metrics.counter(
+    'bot_translation_upstream_requests_total', 'Запросы к источникам перевода по статусу', ('provider', 'status')
+)
+TRANSLATION_TIMEOUTS = metrics.counter(
+    'bot_translation_upstream_timeouts_total', 'Таймауты запросов к источникам перевода', ('provider',)
+)
+TEXT_TRANSLATIONS = metrics.counter(
+    'bot_text_translations_total', 'Переводы сообщений пользователей по источнику ответа', ('source',)
+)
+TEXT_CORRECTIONS = metrics.counter(
+    'bot_text_corrections_total', 'Опечатки в сообщениях: исправленные и с подсказкой', ('kind',)
+)
+REVIEW_ANSWERS = metrics.counter(
+    'bot_review_answers_total', 'Ответы при повторении слов по оценке', ('grade',)
+)
+
+def observe_translation(provider: str, status: str, duration: float):
+    """Запись метрик запроса к источнику перевода и его времени в разбивке медленных запросов"""
+    record(UPSTREAM, duration)
+    if not metrics.enabled:
+        return
+    TRANSLATION_LATENCY.observe(duration, provider)
+    TRANSLATION_REQUESTS.inc(provider, status)
+    if status == 'timeout':
+        TRANSLATION_TIMEOUTS.inc(provider)
+
+# Задержка event loop и профилирование по команде /profile
+loop_monitor = LoopLagMonitor(LOOP_LAG_INTERVAL, LOOP_LAG_THRESHOLD)
+profiler = Profiler()
+
+# Последняя активность пользователей для gauge активных пользователей
+user_last_seen: Dict[int, float] = {}
+
+# Интернированные слова словаря: пользователи хранят только их id
+word_index = WordIndex()
+
+# Пользователи по сроку ближайшего повторения (см. review.py); заполняется из хранилища при старте
+review_queue = DueQueue()
+
+@dataclass(slots=True)
 class UserData:
     """Класс для хранения данных пользователя"""
     level: Optional[str] = None
-    learned_words: Set[str] = field(default_factory=set)
-    daily_words: List[Dict] = field(default_factory=list)
-    last_daily_update: Optional[datetime] = None
+    # Битовая карта по id из word_index
+    learned_words: WordSet = field(default_factory=lambda: WordSet(word_index))
+    # Id слов на сегодня, переводы берутся из словаря и кэша при показе
+    daily_words: array = field(default_factory=lambda: array('I'))
+    last_daily_update: Optional[date] = None
+    # Seed личной перестановки слов и позиция в ней для каждого уровня (см. word_sampler.py)
+    sampler_seed: int = field(default_factory=lambda: random.getrandbits(32))
+    level_cursors: array = field(default_factory=lambda: array('I', bytes(4 * len(LEVELS))))
+    # Интервальное повторение изученных слов
+    reviews: ReviewDeck = field(default_factory=ReviewDeck)
+
+    # Заголовки объекта, массивов и записи LRU (по memory_report.py)
+    BASE_NBYTES = 700
+
+    def nbytes(self) -> int:
+        """Оценка памяти пользователя для бюджета USER_CACHE_MB"""
+        return (
+            self.BASE_NBYTES + self.learned_words.nbytes() + self.reviews.nbytes()
+            + self.daily_words.itemsize * len(self.daily_words)
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Сериализация для хранилища (слова, а не id - id могут меняться между версиями словаря)"""
+        return {
+            'level': self.level,
+            'learned_words': sorted(self.learned_words),
+            'daily_words': [word_index.word(word_id) for word_id in self.daily_words],
+            'last_daily_update': self.last_daily_update.isoformat() if self.last_daily_update else None,
+            'sampler_seed': self.sampler_seed,
+            'level_cursors': dict(zip(LEVELS, self.level_cursors)),
+            'reviews': self.reviews.to_list(word_index.word),
+            # Отдельным полем, чтобы очередь повторений строилась при старте без разбора записей
+            'next_review': self.reviews.next_due()
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'UserData':
+        """Восстановление из хранилища"""
+        last_update = data.get('last_daily_update')
+        # Старый формат хранил карточки слов целиком
+        daily_words = [
+            word['word'] if isinstance(word, dict) else word
+            for word in data.get('daily_words', [])
+        ]
+        user = cls(
+            level=data.get('level'),
+            learned_words=WordSet(word_index, data.get('learned_words', [])),
+            daily_words=array('I', map(word_index.intern, daily_words)),
+            last_daily_update=date.fromisoformat(last_update) if last_update else None,
+            reviews=ReviewDeck.from_list(data.get('reviews', []), word_index.intern)
+        )
+        if 'sampler_seed' in data:
+            user.sampler_seed = data['sampler_seed']
+        cursors = data.get('level_cursors', {})
+        for position, level in enumerate(LEVELS):
+            user.level_cursors[position] = cursors.get(level, 0)
+        return user
+
+@dataclass
+class MessageTranslation:
+    """Перевод сообщения пользователя"""
+    translation: str
+    # Источник: word_bank/fallback/learned (локальный словарь), cache, имя источника перевода, unavailable
+    source: str
+    # Слово, к которому исправлена опечатка, или похожее слово для подсказки
+    corrected: Optional[str] = None
+    suggestion: Optional[str] = None
+
+@dataclass
+class DailyDigest:
+    """
+    Заранее подготовленное ежедневное сообщение. Слова записываются в данные
+    пользователя только после отправки, до нее у него остаются прежние слова.
+    """
+    date: date
+    level: str
+    words: array
+    # Слова пользователя на момент подготовки: если они изменились, сообщение устарело
+    previous: array
+    text: str
+    complete: bool = True
+
+# Шард этого экземпляра; ежедневные задачи выполняются под арендой в общем хранилище
+shards = Sharding(SHARD_INDEX, SHARD_COUNT)
+lease_store = create_lease_store(USER_STORE_BACKEND, USER_STORE_DB)
+INSTANCE_ID = instance_id()
+
+# Данные пользователей шарда: загружаются по требованию, изменения сохраняются пачками
+user_data: UserRepository[UserData] = UserRepository(
+    create_user_store(USER_STORE_BACKEND, USER_STORE_DB),
+    encode=UserData.to_dict,
+    decode=UserData.from_dict,
+    flush_interval=USER_STORE_FLUSH_INTERVAL,
+    batch_size=USER_STORE_BATCH,
+    owns=shards.owns,
+    sizeof=UserData.nbytes,
+    budget=int(USER_CACHE_MB * 1024 * 1024),
+    min_idle=USER_CACHE_MIN_IDLE
+)
+
+# Подготовленные ежедневные сообщения
+daily_digests: Dict[int, DailyDigest] = {}
 
-# Хранение данных пользователей в памяти
-user_data: Dict[int, UserData] = {}
+# Резервные слова если основной источник недоступен
+FALLBACK_WORDS_BY_LEVEL = {
+    'A1': [
+        {'word': 'cat', 'definition': 'a small domesticated carnivorous mammal', 'translation': 'кот'},
+        {'word': 'dog', 'definition': 'a domesticated carnivorous mammal', 'translation': 'собака'},
+        {'word': 'house', 'definition': 'a building for human habitation', 'translation': 'дом'},
+        {'word': 'car', 'definition': 'a road vehicle powered by a motor', 'translation': 'машина'},
+        {'word': 'book', 'definition': 'a written or printed work consisting of pages', 'translation': 'книга'},
+        {'word': 'water', 'definition': 'a colorless, transparent, odorless liquid', 'translation': 'вода'},
+        {'word': 'food', 'definition': 'any nutritious substance that people eat', 'translation': 'еда'},
+        {'word': 'table', 'definition': 'a piece of furniture with a flat top', 'translation': 'стол'},
+        {'word': 'chair', 'definition': 'a separate seat for one person', 'translation': 'стул'},
+        {'word': 'window', 'definition': 'an opening in a wall fitted with glass', 'translation': 'окно'}
+    ],
+    'A2': [
+        {'word': 'school', 'definition': 'an institution for learning', 'translation': 'школа'},
+        {'word': 'friend', 'definition': 'a person you like and know well', 'translation': 'друг'},
+        {'word': 'family', 'definition': 'a group of related people', 'translation': 'семья'},
+        {'word': 'work', 'definition': 'activity involving effort', 'translation': 'работа'},
+        {'word': 'money', 'definition': 'medium of exchange', 'translation': 'деньги'}
+    ]
+}
 
 class EnglishLearningBot:
     """Основной класс бота для изучения английского"""
     
-    def __init__(self, words_file: str = WORDS_FILE):
+    def __init__(self, words_file: str = WORDS_FILE, artifact_file: Optional[str] = WORD_BANK_ARTIFACT):
         self.moscow_tz = pytz.timezone('Europe/Moscow')
-        self.level_word_bank = self._load_word_bank(words_file)
+        # Собранный словарь с переводами (см. word_bank.py) читается через mmap
+        self.word_bank_artifact = load_artifact(artifact_file, words_file) if artifact_file else None
+        if self.word_bank_artifact is not None:
+            self.level_word_bank = dict(self.word_bank_artifact.levels)
+            logger.info(f"Загружен словарь {artifact_file}: {len(self.word_bank_artifact)} слов")
+        else:
+            self.level_word_bank = self._load_word_bank(words_file)
+        # Порядок id совпадает с порядком слов в собранном словаре
+        for level_words in self.level_word_bank.values():
+            word_index.extend(level_words)
+        self._local_translations = self.local_translations()
         self.session: Optional[aiohttp.ClientSession] = None
+        self.ready = False
+        self.translation_cache = TranslationCache(
+            TRANSLATION_CACHE_DB, TRANSLATION_CACHE_SIZE, TRANSLATION_CACHE_TTL
+        )
+        # Отдельные слова переводятся из локального словаря без сети
+        self.lexicon = self._build_lexicon()
+        self.inline_index_en, self.inline_index_ru = self._build_inline_indexes()
+        self.translation_quota = TranslationQuota(
+            TRANSLATION_DAILY_CHARS, TRANSLATION_QUOTA_WINDOW, TRANSLATION_BACKGROUND_RESERVE
+        )
+        # Интерактивные запросы проходят к API раньше фоновых (см. translation_quota.py)
+        self.translation_providers = create_providers(self.get_session, self.translation_quota)
+        self.translation_api = self.translation_providers[0]
+        self.translator = self._create_translator()
+        self._inflight_translations: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._shared_decks: Dict[Tuple[date, str, int], asyncio.Future] = {}
+
+    def _build_lexicon(self) -> Lexicon:
+        """Словарь en<->ru из собранного артефакта, резервного словаря и кэша переводов"""
+        lexicon = Lexicon()
+        langpair = self._get_langpair('ru')
+        for level in LEVELS:
+            for word in self.level_word_bank.get(level, []):
+                if self.word_bank_artifact is not None:
+                    translation = self.word_bank_artifact.translate(word)
+                    if translation:
+                        lexicon.add(word, translation, 'word_bank')
+                        continue
+                translation = self._local_translations.get(word)
+                if translation:
+                    lexicon.add(word, translation, 'fallback')
+                    continue
+                translation = self.translation_cache.get_stale(word, langpair)
+                if translation:
+                    lexicon.add(word, translation, 'learned')
+        for word, translation in self._local_translations.items():
+            lexicon.add(word, translation, 'fallback')
+        for level_words in self.level_word_bank.values():
+            lexicon.add_vocabulary(level_words)
+        logger.info(f"Локальный словарь: {len(lexicon)} слов")
+        return lexicon
+
+    def _build_inline_indexes(self) -> Tuple[PrefixIndex, PrefixIndex]:
+        """Индексы по началу слова для inline-режима: слова CEFR и известные русские переводы"""
+        word_levels = {}
+        for level in LEVELS:
+            for word in self.level_word_bank.get(level, []):
+                word_levels.setdefault(normalize_word(word), (word, level))
+        # Слова добавлены от A1 к C2, порядок добавления поднимает простые слова выше
+        en_index = PrefixIndex(
+            ((key, word_level) for key, word_level in word_levels.items()), limit=INLINE_RESULTS
+        )
+        ru_index = PrefixIndex(
+            ((variant, (variant, english)) for variant, english in self.lexicon.reverse_items()), limit=INLINE_RESULTS
+        )
+        return en_index, ru_index
+
+    def inline_suggestions(self, text: str) -> List[Tuple[str, Optional[str], Optional[str]]]:
+        """Подсказки по началу слова: (слово, перевод или None, уровень или None), только из памяти"""
+        prefix = normalize_word(text)
+        if not prefix:
+            return []
+        if self._detect_language(prefix) == 'ru':
+            return [
+                (variant, ', '.join(english[:3]), None)
+                for variant, english in self.inline_index_ru.search(prefix)
+            ]
+        return [
+            (word, self.lexicon.translation(word), level)
+            for word, level in self.inline_index_en.search(prefix)
+        ]
 
     def _load_word_bank(self, words_file: str) -> Dict[str, List[str]]:
         """Загрузка словаря из файла с обработкой ошибок"""
@@ -65,20 +401,38 @@ class EnglishLearningBot:
     async def get_session(self) -> aiohttp.ClientSession:
         """Получение или создание HTTP сессии"""
         if self.session is None or self.session.closed:
-            timeout = aiohttp.ClientTimeout(total=TRANSLATION_TIMEOUT)
-            self.session = aiohttp.ClientSession(timeout=timeout)
+            self.session = create_session()
         return self.session
 
     async def close_session(self):
         """Закрытие HTTP сессии"""
         if self.session and not self.session.closed:
             await self.session.close()
+        self.translation_cache.close()
 
     def get_user_data(self, user_id: int) -> UserData:
         """Получить данные пользователя"""
-        if user_id not in user_data:
-            user_data[user_id] = UserData()
-        return user_data[user_id]
+        user_info = user_data.get(user_id)
+        if user_info is None:
+            user_info = UserData()
+            user_data[user_id] = user_info
+        return user_info
+
+    def save_user_data(self, user_id: int, user_info: UserData):
+        """Отметить данные пользователя для сохранения в хранилище"""
+        user_data.mark_dirty(user_id, user_info)
+
+    def review_day(self) -> int:
+        """Номер текущего дня по Москве для сроков повторения"""
+        return datetime.now(self.moscow_tz).date().toordinal()
+
+    def learn_daily_words(self, user_id: int, user_info: UserData):
+        """Отметка текущих слов изученными и постановка их на повторение"""
+        today = self.review_day()
+        for word_id in user_info.daily_words:
+            user_info.learned_words.add_id(word_id)
+            user_info.reviews.add(word_id, today)
+        review_queue.schedule(user_id, user_info.reviews.next_due())
 
     async def fetch_words_by_level(self, level: str, count: int = 5) -> List[Dict]:
         """
@@ -101,28 +455,141 @@ class EnglishLearningBot:
 
             # Перемешиваем и выбираем нужное количество
             selected_words = random.sample(word_list, min(count, len(word_list)))
-
-            words = []
-            for word in selected_words:
-                translation = await self.translate_text(word, 'ru')
-                words.append({
-                    'word': word,
-                    'definition': "-",
-                    'translation': translation
-                })
-            return words
+            return await self._build_words(selected_words)
             
         except Exception as e:
             logger.error(f"Ошибка загрузки слов для уровня {level}: {e}")
             return await self._get_fallback_words(level, count)
 
-    async def translate_text(self, text: str, target_lang: str = 'ru') -> str:
+    async def fetch_unseen_words(self, user_info: UserData, count: int = 5) -> List[Dict]:
+        """
+        Следующие непросмотренные слова уровня пользователя
+        
+        Слова выдаются по личной перестановке пользователя, поэтому переводятся
+        только те слова, которые действительно будут показаны.
+        
+        Returns:
+            Список слов; пустой список означает, что все слова уровня пройдены
+        """
+        count = min(count, MAX_WORDS_PER_REQUEST)
+        level = user_info.level.upper()
+        word_list = self.level_word_bank.get(level, [])
+        if not word_list or level not in LEVELS:
+            return await self.fetch_words_by_level(level, count)
+
+        position = level_position(level)
+        indexes, cursor = draw_unseen(
+            len(word_list),
+            user_info.sampler_seed * len(LEVELS) + position,
+            user_info.level_cursors[position],
+            count,
+            lambda index: word_list[index] in user_info.learned_words
+        )
+        user_info.level_cursors[position] = cursor
+        return await self._build_words([word_list[index] for index in indexes])
+
+    async def fetch_shared_words(self, level: str, day: date, user_id: int,
+                                 learned_words: WordSet, count: int = 5) -> List[Dict]:
+        """
+        Слова из общей колоды уровня на день, без уже изученных пользователем
+        
+        Колода переводится один раз на уровень (и когорту) и переиспользуется
+        для всех пользователей, поэтому число переводов не зависит от их количества.
+        """
+        count = min(count, MAX_WORDS_PER_REQUEST)
+        level = level.upper()
+        deck = await self._get_shared_deck(level, day, user_id % DAILY_DECK_COHORTS)
+        words = [dict(word_info) for word_info in deck if word_info['word'] not in learned_words][:count]
+        await self._resolve_deck_words(deck, words)
+
+        if len(words) < count:
+            # Общая колода почти вся изучена - добираем слова индивидуально
+            chosen = {word_info['word'] for word_info in words}
+            unseen = [
+                word for word in self.level_word_bank.get(level, [])
+                if word not in learned_words and word not in chosen
+            ]
+            if unseen:
+                extra = random.sample(unseen, min(count - len(words), len(unseen)))
+                words.extend(await self._build_words(extra))
+        if not words:
+            words = [dict(word_info) for word_info in deck[:count]]
+            await self._resolve_deck_words(deck, words)
+        return words
+
+    async def _resolve_deck_words(self, deck: List[Dict], words: List[Dict]):
+        """
+        Повторный перевод слов колоды, не переведенных при сборке. Полученные переводы
+        сохраняются и в общей колоде, чтобы следующие пользователи не получали заглушку.
+        """
+        unresolved = [word_info for word_info in words if self.is_unresolved(word_info)]
+        if not unresolved:
+            return
+        resolved = {
+            word_info['word']: word_info['translation']
+            for word_info in await self._build_words([word_info['word'] for word_info in unresolved])
+            if not self.is_unresolved(word_info)
+        }
+        for word_info in (*unresolved, *deck):
+            if word_info['word'] in resolved:
+                word_info['translation'] = resolved[word_info['word']]
+
+    async def _get_shared_deck(self, level: str, day: date, cohort: int) -> List[Dict]:
+        """Общая колода; одновременные запросы ждут одну сборку"""
+        key = (day, level, cohort)
+        task = self._shared_decks.get(key)
+        if task is None:
+            # Колоды прошлых дней больше не нужны
+            for old_key in [k for k in self._shared_decks if k[0] != day]:
+                del self._shared_decks[old_key]
+            task = asyncio.ensure_future(self._build_shared_deck(level, day, cohort))
+            self._shared_decks[key] = task
+
+        try:
+            return await asyncio.shield(task)
+        except Exception:
+            self._shared_decks.pop(key, None)
+            raise
+
+    async def _build_shared_deck(self, level: str, day: date, cohort: int) -> List[Dict]:
+        """Сборка общей колоды; выбор слов детерминирован для дня, уровня и когорты"""
+        word_list = self.level_word_bank.get(level, [])
+        if not word_list:
+            logger.warning(f"Слова для уровня {level} не найдены")
+            return await self._get_fallback_words(level, SHARED_DECK_SIZE)
+
+        rng = random.Random(f"{day.isoformat()}:{level}:{cohort}")
+        selected_words = rng.sample(word_list, min(SHARED_DECK_SIZE, len(word_list)))
+        return await self._build_words(selected_words)
+
+    async def _build_words(self, selected_words: List[str]) -> List[Dict]:
+        """Карточки слов с переводами"""
+        # Переводы из локальных источников, в сеть идут только недостающие
+        translations = {}
+        for word in selected_words:
+            translation = self.known_translation(word)
+            if translation:
+                translations[word] = translation
+
+        missing = [word for word in selected_words if word not in translations]
+        if missing:
+            # Кэш уже проверен known_translation - промах не считается второй раз
+            translations.update(zip(missing, await self.translate_many(missing, 'ru', use_cache=False)))
+
+        return [
+            {'word': word, 'definition': "-", 'translation': translations[word]}
+            for word in selected_words
+        ]
+
+    @traced('translate_text', SLOW_REQUEST_THRESHOLD, describe=lambda self, text, *args: repr(text[:50]))
+    async def translate_text(self, text: str, target_lang: str = 'ru', use_cache: bool = True) -> str:
         """
-        Перевод текста через MyMemory Translation API
+        Перевод текста с использованием кэша и MyMemory Translation API
         
         Args:
             text: Текст для перевода
             target_lang: Целевой язык ('ru' или 'en')
+            use_cache: False, если вызывающий уже проверил кэш
             
         Returns:
             Переведенный текст
@@ -130,57 +597,177 @@ class EnglishLearningBot:
         if not text or not text.strip():
             return "Пустой текст"
 
+        translated, _ = await self.lookup_translation_source(text, target_lang, use_cache)
+        if translated is None:
+            return self.unavailable_translation(text)
+        return translated
+
+    async def lookup_translation(self, text: str, target_lang: str = 'ru') -> Optional[str]:
+        """Перевод текста через кэш и API; None если перевод не получен"""
+        translated, _ = await self.lookup_translation_source(text, target_lang)
+        return translated
+
+    async def lookup_translation_source(self, text: str, target_lang: str = 'ru',
+                                        use_cache: bool = True) -> Tuple[Optional[str], str]:
+        """Перевод текста через кэш и API и его источник: 'cache', имя источника перевода или 'unavailable'"""
+        langpair = self._get_langpair(target_lang)
+        cached = self.translation_cache.get(text, langpair) if use_cache else None
+        if cached is not None:
+            return cached, 'cache'
+
+        # Одинаковые одновременные запросы ждут один общий запрос к API
+        key = (normalize_text(text), langpair)
+        task = self._inflight_translations.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._translate_upstream(text, langpair, translation_priority.get()))
+            self._inflight_translations[key] = task
+            task.add_done_callback(lambda _: self._inflight_translations.pop(key, None))
+            return await asyncio.shield(task)
+
+        # Время запроса к API учитывается в разбивке того, кто его начал; ожидающие учитывают ожидание
+        started = time_module.perf_counter()
         try:
-            session = await self.get_session()
-            url = "https://api.mymemory.translated.net/get"
-            params = {
-                'q': text.strip(),
-                'langpair': f'en|{target_lang}' if target_lang == 'ru' else f'ru|en'
-            }
-
-            async with session.get(url, params=params) as response:
-                if response.status == 200:
-                    data = await response.json()
-                    translated = data.get('responseData', {}).get('translatedText', '')
-                    return translated if translated else f"Перевод для '{text}' недоступен"
-                else:
-                    logger.warning(f"API вернул статус {response.status} для текста '{text}'")
-                    
-        except asyncio.TimeoutError:
-            logger.error(f"Таймаут при переводе текста '{text}'")
-        except Exception as e:
-            logger.error(f"Ошибка при переводе '{text}': {e}")
+            return await asyncio.shield(task)
+        finally:
+            record(UPSTREAM, time_module.perf_counter() - started)
+
+    @traced('translate_message', SLOW_REQUEST_THRESHOLD, describe=lambda self, text: repr(text[:50]))
+    async def translate_message(self, text: str) -> MessageTranslation:
+        """
+        Перевод сообщения пользователя с источником ответа.
+
+        Слова из словаря переводятся без сети; явная опечатка в слове исправляется
+        до запроса к API, для сомнительных случаев предлагается похожее слово.
+        """
+        source_lang = self._detect_language(text)
+        target_lang = 'en' if source_lang == 'ru' else 'ru'
+        entry = self.lexicon.lookup(text, source_lang)
+        if entry is not None:
+            return MessageTranslation(entry.translation, entry.source)
+
+        correction = self.lexicon.correct(text, source_lang)
+        if correction is not None and correction.confident:
+            entry = self.lexicon.lookup(correction.word, source_lang)
+            if entry is not None:
+                return MessageTranslation(entry.translation, entry.source, corrected=correction.word)
+            # Слово из словаря CEFR без известного перевода - переводим исправленное
+            translated, source = await self.lookup_translation_source(correction.word, target_lang)
+            if translated is not None:
+                return MessageTranslation(translated, source, corrected=correction.word)
+            # Исходный текст - опечатка: повторный запрос к API потратил бы бюджет впустую
+            return MessageTranslation(self.unavailable_translation(text), source, suggestion=correction.suggestion)
+
+        translated, source = await self.lookup_translation_source(text, target_lang)
+        return MessageTranslation(
+            translated if translated is not None else self.unavailable_translation(text),
+            source,
+            suggestion=correction.suggestion if correction is not None else None
+        )
+
+    async def translate_many(self, texts: List[str], target_lang: str = 'ru', use_cache: bool = True) -> List[str]:
+        """Параллельный перевод списка текстов с сохранением порядка"""
+        results = await asyncio.gather(
+            *(self.translate_text(text, target_lang, use_cache) for text in texts),
+            return_exceptions=True
+        )
+        translations = []
+        for text, result in zip(texts, results):
+            if isinstance(result, BaseException):
+                logger.error(f"Ошибка при переводе '{text}': {result}")
+                result = self.unavailable_translation(text)
+            translations.append(result)
+        return translations
+
+    def _create_translator(self) -> HedgedTranslator:
+        """Цепочка источников: основной API, запасные сервисы, локальные данные"""
+        self.translation_batchers = [
+            BatchingProvider(provider, max_items=TRANSLATION_BATCH_SIZE, window=TRANSLATION_BATCH_WINDOW)
+            for provider in self.translation_providers
+        ]
+        backends = [
+            Backend(provider, CircuitBreaker(provider.name, open_seconds=TRANSLATION_BREAKER_OPEN))
+            for provider in self.translation_batchers
+        ]
+        backends.append(Backend(LocalProvider('local', self.local_translation)))
+        return HedgedTranslator(
+            backends,
+            hedge=TRANSLATION_HEDGE,
+            max_hedge_delay=TRANSLATION_HEDGE_MAX_DELAY,
+            deadline=TRANSLATION_DEADLINE,
+            observer=observe_translation,
+            on_late_result=self.translation_cache.set
+        )
+
+    async def _translate_upstream(self, text: str, langpair: str, priority: int) -> Tuple[Optional[str], str]:
+        """Перевод через цепочку источников; в кэш попадают только переводы из сети"""
+        translated, provider = await self.translator.translate(text, langpair, priority)
+        if translated is None:
+            return None, 'unavailable'
+        if provider.cacheable:
+            self.translation_cache.set(text, langpair, translated)
+            # Полученный перевод слова из словаря CEFR пополняет локальный словарь
+            if langpair == self._get_langpair('ru') and word_index.get_id(text.strip().lower()) is not None:
+                self.lexicon.add(text.strip().lower(), translated, 'learned')
+        return translated, provider.name
 
+    def unavailable_translation(self, text: str) -> str:
+        """Текст для слова, перевод которого получить не удалось"""
         return f"Перевод для '{text}' недоступен"
 
+    def is_unresolved(self, word_info: Dict) -> bool:
+        """Карточка слова с заглушкой вместо перевода"""
+        return word_info['translation'] == self.unavailable_translation(word_info['word'])
+
+    def _get_langpair(self, target_lang: str) -> str:
+        """Языковая пара для MyMemory API"""
+        return langpair(target_lang)
+
     async def _get_fallback_words(self, level: str, count: int) -> List[Dict]:
         """Резервные слова если основной источник недоступен"""
-        fallback_words_by_level = {
-            'A1': [
-                {'word': 'cat', 'definition': 'a small domesticated carnivorous mammal', 'translation': 'кот'},
-                {'word': 'dog', 'definition': 'a domesticated carnivorous mammal', 'translation': 'собака'},
-                {'word': 'house', 'definition': 'a building for human habitation', 'translation': 'дом'},
-                {'word': 'car', 'definition': 'a road vehicle powered by a motor', 'translation': 'машина'},
-                {'word': 'book', 'definition': 'a written or printed work consisting of pages', 'translation': 'книга'},
-                {'word': 'water', 'definition': 'a colorless, transparent, odorless liquid', 'translation': 'вода'},
-                {'word': 'food', 'definition': 'any nutritious substance that people eat', 'translation': 'еда'},
-                {'word': 'table', 'definition': 'a piece of furniture with a flat top', 'translation': 'стол'},
-                {'word': 'chair', 'definition': 'a separate seat for one person', 'translation': 'стул'},
-                {'word': 'window', 'definition': 'an opening in a wall fitted with glass', 'translation': 'окно'}
-            ],
-            'A2': [
-                {'word': 'school', 'definition': 'an institution for learning', 'translation': 'школа'},
-                {'word': 'friend', 'definition': 'a person you like and know well', 'translation': 'друг'},
-                {'word': 'family', 'definition': 'a group of related people', 'translation': 'семья'},
-                {'word': 'work', 'definition': 'activity involving effort', 'translation': 'работа'},
-                {'word': 'money', 'definition': 'medium of exchange', 'translation': 'деньги'}
-            ]
-        }
-
         # Используем слова A1 для всех уровней, если конкретный уровень не найден
-        base_words = fallback_words_by_level.get(level, fallback_words_by_level['A1'])
+        base_words = FALLBACK_WORDS_BY_LEVEL.get(level, FALLBACK_WORDS_BY_LEVEL['A1'])
         return random.sample(base_words, min(count, len(base_words)))
 
+    def local_translation(self, text: str, langpair: str) -> Optional[str]:
+        """Перевод без сети, когда API недоступен: словари и устаревшие записи кэша"""
+        if langpair == self._get_langpair('ru'):
+            word = text.strip().lower()
+            if self.word_bank_artifact is not None:
+                translation = self.word_bank_artifact.translate(word)
+                if translation:
+                    return translation
+            translation = self._local_translations.get(word)
+            if translation:
+                return translation
+        return self.translation_cache.get_stale(text, langpair)
+
+    def known_translation(self, word: str) -> Optional[str]:
+        """Перевод слова из собранного словаря, резервного словаря или кэша без обращения к сети"""
+        if self.word_bank_artifact is not None:
+            translation = self.word_bank_artifact.translate(word)
+            if translation:
+                return translation
+        translation = self._local_translations.get(word)
+        if translation:
+            return translation
+        return self.translation_cache.get(word, self._get_langpair('ru'))
+
+    def word_ids(self, words: List[Dict]) -> array:
+        """Id слов из карточек для хранения в UserData"""
+        return array('I', (word_index.intern(word_info['word']) for word_info in words))
+
+    async def resolve_words(self, word_ids: array) -> List[Dict]:
+        """Карточки слов по id; недостающие переводы запрашиваются заново"""
+        return await self._build_words([word_index.word(word_id) for word_id in word_ids])
+
+    def local_translations(self) -> Dict[str, str]:
+        """Переводы из встроенного резервного словаря"""
+        return {
+            word_info['word']: word_info['translation']
+            for words in FALLBACK_WORDS_BY_LEVEL.values()
+            for word_info in words
+        }
+
     def format_words_text(self, words: List[Dict], level: str, title: str = "слова") -> str:
         """Форматирование текста со словами"""
         if not words:
@@ -200,6 +787,9 @@ class EnglishLearningBot:
 # Инициализация бота
 bot = EnglishLearningBot()
 
+# Пересылка обновлений пользователей других шардов
+shard_router = ShardRouter(SHARD_PEERS, WEBHOOK_PATH, bot.get_session, secret_token=WEBHOOK_SECRET)
+
 def create_level_keyboard() -> InlineKeyboardMarkup:
     """Создание клавиатуры выбора уровня"""
     keyboard = [
@@ -221,6 +811,14 @@ def create_main_keyboard() -> InlineKeyboardMarkup:
     ]
     return InlineKeyboardMarkup(keyboard)
 
+def level_exhausted_text(user_info: UserData) -> str:
+    """Сообщение о том, что все слова уровня пройдены"""
+    return (
+        f"🎉 Вы прошли все слова уровня {user_info.level}!\n"
+        f"📈 Изучено слов: {len(user_info.learned_words)}\n\n"
+        "Выберите следующий уровень:"
+    )
+
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /start"""
     welcome_text = """🎓 Добро пожаловать в English Learning Bot!
@@ -240,6 +838,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 /more - получить дополнительные слова
 /level - изменить уровень
 /stats - статистика изучения
+/review - повторить изученные слова
 /test_daily - тест ежедневной отправки"""
 
     await update.message.reply_text(welcome_text, reply_markup=create_level_keyboard())
@@ -254,15 +853,24 @@ async def handle_level_selection(update: Update, context: ContextTypes.DEFAULT_T
     
     user_info = bot.get_user_data(user_id)
     user_info.level = level
+    bot.save_user_data(user_id, user_info)
     
     # Показываем индикатор загрузки
     await query.edit_message_text("⏳ Загружаю слова с переводами...")
     
     try:
-        # Загружаем первые слова
-        words = await bot.fetch_words_by_level(level, 5)
-        user_info.daily_words = words
+        # Загружаем первые еще не показанные слова уровня
+        words = await bot.fetch_unseen_words(user_info, 5)
+        if not words:
+            bot.save_user_data(user_id, user_info)
+            await query.edit_message_text(
+                level_exhausted_text(user_info),
+                reply_markup=create_level_keyboard()
+            )
+            return
+        user_info.daily_words = bot.word_ids(words)
         user_info.last_daily_update = datetime.now(bot.moscow_tz).date()
+        bot.save_user_data(user_id, user_info)
         
         words_text = f"✅ Уровень {level} установлен!\n\n"
         words_text += bot.format_words_text(words, level, "слова на сегодня")
@@ -296,25 +904,24 @@ async def handle_more_words(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await query.edit_message_text("⏳ Загружаю новые слова с переводами...")
     
     try:
-        # Отмечаем текущие слова как изученные
-        for word_info in user_info.daily_words:
-            if 'word' in word_info:
-                user_info.learned_words.add(word_info['word'])
+        # Отмечаем текущие слова как изученные и ставим на повторение
+        bot.learn_daily_words(user_id, user_info)
         
-        # Загружаем новые слова
-        new_words = await bot.fetch_words_by_level(user_info.level, 5)
+        # Загружаем новые, еще не показанные слова
+        new_words = await bot.fetch_unseen_words(user_info, 5)
+        bot.save_user_data(user_id, user_info)
         
-        # Фильтруем уже изученные слова
-        filtered_words = [w for w in new_words if w.get('word') not in user_info.learned_words]
-        
-        if not filtered_words:
-            # Если все слова уже изучены, берем любые
-            filtered_words = new_words
+        if not new_words:
+            await query.edit_message_text(
+                level_exhausted_text(user_info),
+                reply_markup=create_level_keyboard()
+            )
+            return
         
-        user_info.daily_words = filtered_words
+        user_info.daily_words = bot.word_ids(new_words)
         
         words_text = "🆕 " + bot.format_words_text(
-            filtered_words, user_info.level, "новые слова"
+            new_words, user_info.level, "новые слова"
         )
         words_text += f"\n📈 Изучено слов: {len(user_info.learned_words)}"
         
@@ -355,7 +962,8 @@ async def handle_back_to_words(update: Update, context: ContextTypes.DEFAULT_TYP
         await query.edit_message_text("❌ Сначала выберите уровень командой /start")
         return
     
-    words_text = bot.format_words_text(user_info.daily_words, user_info.level, "текущие слова")
+    words = await bot.resolve_words(user_info.daily_words)
+    words_text = bot.format_words_text(words, user_info.level, "текущие слова")
     
     await query.edit_message_text(
         words_text, 
@@ -373,6 +981,20 @@ async def handle_change_level(update: Update, context: ContextTypes.DEFAULT_TYPE
         reply_markup=create_level_keyboard()
     )
 
+def translation_source_label(source: str) -> str:
+    """Подпись источника перевода в ответе пользователю"""
+    if source in ('word_bank', 'fallback', 'learned'):
+        return "📖 из словаря"
+    if source == APPROXIMATE:
+        return "📖 из словаря по начальной форме, возможна неточность"
+    if source == 'cache':
+        return "💾 из кэша"
+    if source == 'local':
+        return "📦 сохраненный перевод"
+    if source == 'unavailable':
+        return ""
+    return "🌐 онлайн-переводчик"
+
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка текстовых сообщений (для перевода)"""
     if not update.message or not update.message.text:
@@ -384,21 +1006,44 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
     
     try:
-        # Определяем язык и переводим
-        source_lang = bot._detect_language(text)
-        target_lang = 'en' if source_lang == 'ru' else 'ru'
-        
-        translation = await bot.translate_text(text, target_lang)
+        # Определяем язык и переводим: отдельные слова - из локального словаря, остальное - через API
+        result = await bot.translate_message(text)
+        TEXT_TRANSLATIONS.inc(result.source)
         
-        await update.message.reply_text(
-            f"🔄 **{text}** → {translation}", 
-            parse_mode='Markdown'
-        )
+        notes = []
+        if result.corrected:
+            TEXT_CORRECTIONS.inc('auto')
+            notes.append(f"✏️ исправлено на {result.corrected}")
+        label = translation_source_label(result.source)
+        if label:
+            notes.append(label)
+        reply = f"🔄 **{text}** → {result.translation}"
+        if notes:
+            reply += "\n_" + " · ".join(notes) + "_"
+        if result.suggestion:
+            TEXT_CORRECTIONS.inc('suggested')
+            reply += f"\n❓ Возможно, вы имели в виду: {result.suggestion}"
+        await update.message.reply_text(reply, parse_mode='Markdown')
         
     except Exception as e:
         logger.error(f"Ошибка при переводе текста '{text}': {e}")
         await update.message.reply_text("❌ Ошибка при переводе. Попробуйте позже.")
 
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Inline-режим (@bot слово): подсказки слов с переводом по мере ввода"""
+    query = update.inline_query
+    results = []
+    for number, (word, translation, level) in enumerate(bot.inline_suggestions(query.query)):
+        translation = translation or "перевод появится позже"
+        level_text = f" ({level})" if level else ""
+        results.append(InlineQueryResultArticle(
+            id=str(number),
+            title=f"{word} — {translation}",
+            description=f"Уровень {level}" if level else None,
+            input_message_content=InputTextMessageContent(f"🔤 {word} — {translation}{level_text}")
+        ))
+    await query.answer(results, cache_time=INLINE_CACHE_TIME, is_personal=False)
+
 async def translate_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /translate"""
     await update.message.reply_text(
@@ -419,14 +1064,18 @@ async def more_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Показываем индикатор загрузки
         loading_msg = await update.message.reply_text("⏳ Загружаю новые слова с переводами...")
         
-        # Отмечаем текущие слова как изученные
-        for word_info in user_info.daily_words:
-            if 'word' in word_info:
-                user_info.learned_words.add(word_info['word'])
+        # Отмечаем текущие слова как изученные и ставим на повторение
+        bot.learn_daily_words(user_id, user_info)
+        
+        # Загружаем новые, еще не показанные слова
+        new_words = await bot.fetch_unseen_words(user_info, 5)
+        bot.save_user_data(user_id, user_info)
         
-        # Загружаем новые слова
-        new_words = await bot.fetch_words_by_level(user_info.level, 5)
-        user_info.daily_words = new_words
+        if not new_words:
+            await loading_msg.edit_text(level_exhausted_text(user_info), reply_markup=create_level_keyboard())
+            return
+        
+        user_info.daily_words = bot.word_ids(new_words)
         
         words_text = "🆕 " + bot.format_words_text(
             new_words, user_info.level, "новые слова"
@@ -478,10 +1127,15 @@ async def test_daily_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         # Показываем индикатор загрузки
         loading_msg = await update.message.reply_text("⏳ Тест загрузки: получаю слова с переводами...")
         
-        # Принудительно загружаем новые слова
-        new_words = await bot.fetch_words_by_level(user_info.level, 5)
-        user_info.daily_words = new_words
+        # Принудительно загружаем новые, еще не показанные слова
+        new_words = await bot.fetch_unseen_words(user_info, 5)
+        if not new_words:
+            bot.save_user_data(user_id, user_info)
+            await loading_msg.edit_text(level_exhausted_text(user_info), reply_markup=create_level_keyboard())
+            return
+        user_info.daily_words = bot.word_ids(new_words)
         user_info.last_daily_update = datetime.now(bot.moscow_tz).date()
+        bot.save_user_data(user_id, user_info)
         
         words_text = "🧪 ТЕСТ: " + bot.format_words_text(
             new_words, user_info.level, "ваши слова на сегодня"
@@ -494,41 +1148,331 @@ async def test_daily_command(update: Update, context: ContextTypes.DEFAULT_TYPE)
         logger.error(f"Ошибка в тестовой команде для пользователя {user_id}: {e}")
         await update.message.reply_text("❌ Ошибка при тестировании. Попробуйте позже.")
 
+REVIEW_GRADES = ((AGAIN, "❌ Не помню"), (HARD, "😐 Трудно"), (GOOD, "🙂 Помню"), (EASY, "😎 Легко"))
+
+def create_review_keyboard(word_id: int, revealed: bool) -> InlineKeyboardMarkup:
+    """Кнопка показа перевода, после нее - оценки ответа"""
+    if not revealed:
+        keyboard = [[InlineKeyboardButton("👀 Показать перевод", callback_data=f"review_show_{word_id}")]]
+    else:
+        buttons = [
+            InlineKeyboardButton(label, callback_data=f"review_grade_{word_id}_{grade}")
+            for grade, label in REVIEW_GRADES
+        ]
+        keyboard = [buttons[:2], buttons[2:]]
+    return InlineKeyboardMarkup(keyboard)
+
+def review_prompt(user_info: UserData) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Следующее слово для повторения или сообщение, что повторять нечего"""
+    today = bot.review_day()
+    due = user_info.reviews.due_words(today)
+    if not due:
+        next_due = user_info.reviews.next_due()
+        if next_due is None:
+            return "📭 Слов для повторения пока нет. Изученные слова появятся здесь на следующий день.", None
+        return f"✅ Сейчас повторять нечего. Следующее повторение: {date.fromordinal(next_due):%d.%m.%Y}", None
+    word_id = due[0]
+    text = f"🔁 Повторение (осталось {len(due)})\n\n**{word_index.word(word_id)}**"
+    return text, create_review_keyboard(word_id, revealed=False)
+
+async def review_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /review - повторение изученных слов"""
+    user_info = bot.get_user_data(update.message.from_user.id)
+    text, reply_markup = review_prompt(user_info)
+    await update.message.reply_text(text, parse_mode='Markdown', reply_markup=reply_markup)
+
+async def handle_review(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Показ перевода и оценка ответа при повторении"""
+    query = update.callback_query
+    await query.answer()
+
+    user_id = query.from_user.id
+    user_info = bot.get_user_data(user_id)
+    # review_show_<id> или review_grade_<id>_<оценка>
+    parts = query.data.split('_')
+    try:
+        action, word_id = parts[1], int(parts[2])
+        grade = int(parts[3]) if action == 'grade' else None
+    except (IndexError, ValueError):
+        return
+
+    today = bot.review_day()
+    card = user_info.reviews.card(word_id)
+    # Повторное нажатие на уже оцененное слово показывает следующее
+    if card is not None and card.due <= today:
+        if action == 'show':
+            words = await bot.resolve_words(array('I', [word_id]))
+            await query.edit_message_text(
+                f"🔁 Повторение\n\n**{words[0]['word']}** → {words[0]['translation']}\n\nНасколько легко вы вспомнили?",
+                parse_mode='Markdown',
+                reply_markup=create_review_keyboard(word_id, revealed=True)
+            )
+            return
+        if grade in dict(REVIEW_GRADES):
+            user_info.reviews.answer(word_id, grade, today)
+            review_queue.schedule(user_id, user_info.reviews.next_due())
+            bot.save_user_data(user_id, user_info)
+            REVIEW_ANSWERS.inc(str(grade))
+
+    text, reply_markup = review_prompt(user_info)
+    await query.edit_message_text(text, parse_mode='Markdown', reply_markup=reply_markup)
+
+def is_admin(user_id: int) -> bool:
+    return user_id in ADMIN_USER_IDS
+
+async def quota_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /quota - бюджет символов API перевода (только для администраторов)"""
+    if not is_admin(update.effective_user.id):
+        return
+
+    quota = bot.translation_quota
+    remaining = quota.remaining
+    hours, seconds = divmod(int(quota.resets_in), 3600)
+    status = "⛔ исчерпан по ответу API" if quota.exhausted else (
+        "⚠️ фоновые переводы приостановлены"
+        if remaining < quota.limit * quota.background_reserve else "✅ в норме"
+    )
+    await update.message.reply_text(
+        f"📊 Бюджет перевода: {status}\n\n"
+        f"Израсходовано: {quota.used} из {quota.limit} символов\n"
+        f"Осталось: {remaining}\n"
+        f"Резерв для пользователей: {int(quota.limit * quota.background_reserve)}\n"
+        f"Отказов: интерактивных {quota.denied['interactive']}, фоновых {quota.denied['background']}\n"
+        f"Ожидают API: {bot.translation_api.semaphore.waiting()}\n"
+        f"Сброс через {hours} ч {seconds // 60} мин"
+    )
+
+async def profile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Команда /profile N - профиль event loop за N секунд файлом (только для администраторов)"""
+    if not is_admin(update.effective_user.id):
+        return
+    try:
+        seconds = int(context.args[0]) if context.args else 10
+    except ValueError:
+        await update.message.reply_text("Использование: /profile [секунд]")
+        return
+    seconds = max(1, min(seconds, PROFILE_MAX_SECONDS))
+    # Место занимается до первого await, иначе две одновременные команды пройдут проверку
+    if not profiler.reserve():
+        await update.message.reply_text("⏱ Профилирование уже выполняется")
+        return
+
+    async def profile_and_reply():
+        try:
+            report = await profiler.profile(seconds)
+            document = io.BytesIO(report.encode('utf-8'))
+            filename = f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}.txt"
+            await update.message.reply_document(document, filename=filename, caption=f"Профиль за {seconds} с")
+        except Exception as e:
+            logger.error(f"Ошибка профилирования: {e}")
+            try:
+                await update.message.reply_text(f"❌ Профилирование не удалось: {e}")
+            except Exception as reply_error:
+                logger.error(f"Не удалось сообщить об ошибке профилирования: {reply_error}")
+
+    try:
+        await update.message.reply_text(
+            f"⏱ Профилирую {seconds} с. Задержка event loop: сейчас {loop_monitor.last * 1000:.0f} мс, "
+            f"максимум {loop_monitor.max * 1000:.0f} мс, блокировок {loop_monitor.stalls}"
+        )
+    except Exception:
+        profiler.release()
+        raise
+    # Замер идет в фоне, чтобы не занимать место в пуле обработки обновлений
+    context.application.create_task(profile_and_reply())
+
+def render_daily_text(words: List[Dict], level: str) -> str:
+    """Текст ежедневного сообщения"""
+    words_text = "🌅 Доброе утро! " + bot.format_words_text(
+        words, level, "ваши слова на сегодня"
+    )
+    words_text += "\nУдачного изучения! 📚"
+    return words_text
+
+def is_digest_current(digest: Optional[DailyDigest], user_info: UserData, today: date) -> bool:
+    """Подготовленное сообщение актуально, если с тех пор слова пользователя не менялись"""
+    return (
+        digest is not None
+        and digest.complete
+        and digest.date == today
+        and digest.level == user_info.level
+        and digest.previous == user_info.daily_words
+    )
+
+def apply_daily_digest(user_id: int, user_info: UserData, digest: DailyDigest):
+    """Отправленные слова становятся текущими словами пользователя"""
+    if user_info.daily_words == digest.words and user_info.last_daily_update == digest.date:
+        return
+    user_info.daily_words = digest.words
+    user_info.last_daily_update = digest.date
+    bot.save_user_data(user_id, user_info)
+
+async def prepare_daily_digest(user_id: int, user_info: UserData, today: date) -> Optional[DailyDigest]:
+    """Подбор слов, перевод и рендер ежедневного сообщения пользователя"""
+    if not user_info.level:
+        return None
+
+    digest = daily_digests.get(user_id)
+    if is_digest_current(digest, user_info, today):
+        return digest
+
+    # Проверяем, нужно ли обновить слова на сегодня
+    if user_info.last_daily_update != today:
+        # Загружаем новые слова; пользователю они достанутся при отправке сообщения
+        if DAILY_SHARED_DECKS:
+            words = await bot.fetch_shared_words(
+                user_info.level, today, user_id, user_info.learned_words, 5
+            )
+        else:
+            words = await bot.fetch_words_by_level(user_info.level, 5)
+        word_ids = bot.word_ids(words)
+    else:
+        # Переводы берутся из кэша, не полученные в прошлый раз запрашиваются повторно
+        words = await bot.resolve_words(user_info.daily_words)
+        word_ids = user_info.daily_words
+
+    complete = not any(bot.is_unresolved(word_info) for word_info in words)
+    digest = DailyDigest(
+        date=today,
+        level=user_info.level,
+        words=word_ids,
+        previous=user_info.daily_words,
+        text=render_daily_text(words, user_info.level),
+        complete=complete
+    )
+    daily_digests[user_id] = digest
+    return digest
+
+async def prepare_daily_words_job(context: ContextTypes.DEFAULT_TYPE):
+    """Подготовка ежедневных сообщений заранее, до утренней рассылки; каждый проход - один раз на шард"""
+    translation_priority.set(BACKGROUND)
+    try:
+        today = datetime.now(bot.moscow_tz).date()
+        # Проходы за день различаются временем запуска (data задачи)
+        lease = f"prepare_daily:{today.isoformat()}:{context.job.data}:{shards.index}/{shards.count}"
+        if not await run_once(lease_store, lease, INSTANCE_ID, JOB_LEASE_TTL, lambda: prepare_daily_digests(today)):
+            logger.info(f"Подготовка {lease} выполняется или выполнена другим экземпляром")
+    except Exception as e:
+        logger.error(f"Ошибка в задаче подготовки ежедневных слов: {e}")
+
+async def prepare_daily_digests(today: date):
+    """Подготовка ежедневных сообщений пользователей шарда"""
+    prepared = incomplete = 0
+
+    async def prepare_batch(batch: List[Tuple[int, UserData]]):
+        nonlocal prepared, incomplete
+        results = await asyncio.gather(
+            *(prepare_daily_digest(user_id, user_info, today) for user_id, user_info in batch),
+            return_exceptions=True
+        )
+        for (user_id, _), result in zip(batch, results):
+            user_data.release(user_id)
+            if isinstance(result, BaseException):
+                logger.error(f"Ошибка подготовки ежедневных слов: {result}")
+                incomplete += 1
+            elif result is not None:
+                prepared += 1
+                incomplete += not result.complete
+
+    # Пользователи читаются из хранилища пачками, активные в памяти не вытесняются
+    batch = []
+    async for user_id, user_info in user_data.stream(user_data.keys(), DAILY_PREPARE_BATCH):
+        batch.append((user_id, user_info))
+        if len(batch) >= DAILY_PREPARE_BATCH:
+            await prepare_batch(batch)
+            batch = []
+    if batch:
+        await prepare_batch(batch)
+
+    # Сообщения за прошлые дни больше не нужны
+    for user_id, digest in list(daily_digests.items()):
+        if digest.date != today:
+            del daily_digests[user_id]
+
+    logger.info(f"Подготовлено ежедневных сообщений: {prepared}, с ошибками: {incomplete}")
+
+async def collect_review_reminders(today: int) -> Dict[int, int]:
+    """
+    Пользователи, которым пора повторять, и число слов на повторение.
+    Из очереди извлекаются только они; без ответа напоминание повторится завтра.
+    """
+    reminders = {}
+    async for user_id, user_info in user_data.stream(review_queue.pop_due(today)):
+        user_data.release(user_id)
+        due_count = user_info.reviews.due_count(today)
+        if due_count:
+            reminders[user_id] = due_count
+        next_due = user_info.reviews.next_due()
+        review_queue.schedule(user_id, None if next_due is None else max(next_due, today + 1))
+    logger.info(f"Напоминаний о повторении: {len(reminders)}")
+    return reminders
+
+# Текущая или последняя рассылка (для метрик прогресса)
+last_broadcaster: Optional[Broadcaster] = None
+
 async def daily_words_job(context: ContextTypes.DEFAULT_TYPE):
-    """Ежедневная отправка слов в 10:00 по Москве"""
+    """Ежедневная отправка слов в 10:00 по Москве: каждый шард рассылает своим пользователям один раз"""
+    translation_priority.set(BACKGROUND)
     try:
         today = datetime.now(bot.moscow_tz).date()
-        
-        for user_id, user_info in user_data.items():
-            try:
-                if not user_info.level:
-                    continue
-                    
-                # Проверяем, нужно ли обновить слова на сегодня
-                if user_info.last_daily_update != today:
-                    # Загружаем новые слова
-                    new_words = await bot.fetch_words_by_level(user_info.level, 5)
-                    user_info.daily_words = new_words
-                    user_info.last_daily_update = today
-                
-                # Формируем сообщение
-                words_text = "🌅 Доброе утро! " + bot.format_words_text(
-                    user_info.daily_words, user_info.level, "ваши слова на сегодня"
-                )
-                words_text += "\nУдачного изучения! 📚"
-                
-                await context.bot.send_message(
-                    chat_id=user_id,
-                    text=words_text,
-                    parse_mode='Markdown'
-                )
-                
-            except Exception as e:
-                logger.error(f"Ошибка отправки пользователю {user_id}: {e}")
-                
+        lease = f"daily_words:{today.isoformat()}:{shards.index}/{shards.count}"
+        if not await run_once(lease_store, lease, INSTANCE_ID, JOB_LEASE_TTL,
+                              lambda: broadcast_daily_words(context, today)):
+            logger.info(f"Рассылка {lease} выполняется или выполнена другим экземпляром")
     except Exception as e:
         logger.error(f"Ошибка в ежедневной задаче: {e}")
 
+async def broadcast_daily_words(context: ContextTypes.DEFAULT_TYPE, today: date):
+    """Рассылка ежедневных слов пользователям шарда"""
+    reminders = await collect_review_reminders(today.toordinal())
+    # Пользователи читаются из хранилища пачками по мере рассылки, а не все сразу
+    streamed: Dict[int, UserData] = {}
+    # Сообщения в отправке: слова записываются пользователю после доставки
+    sending: Dict[int, DailyDigest] = {}
+
+    async def recipients() -> AsyncIterator[int]:
+        async for user_id, user_info in user_data.stream(user_ids):
+            streamed[user_id] = user_info
+            yield user_id
+
+    async def render(user_id: int) -> Optional[Dict]:
+        user_info = streamed[user_id]
+        if not user_info.level:
+            return None
+
+        # Сообщение подготовлено заранее, если слова с тех пор не менялись
+        digest = daily_digests.get(user_id)
+        if not is_digest_current(digest, user_info, today):
+            digest = await prepare_daily_digest(user_id, user_info, today)
+        daily_digests.pop(user_id, None)
+        sending[user_id] = digest
+        text = digest.text
+        if user_id in reminders:
+            text += f"\n\n🔁 Слов на повторение: {reminders[user_id]} - /review"
+        return {'text': text, 'parse_mode': 'Markdown'}
+
+    def done(user_id: int, sent: bool):
+        user_info = streamed.pop(user_id)
+        digest = sending.pop(user_id, None)
+        try:
+            if sent and digest is not None:
+                apply_daily_digest(user_id, user_info, digest)
+        finally:
+            user_data.release(user_id)
+
+    global last_broadcaster
+    broadcaster = Broadcaster(
+        context.bot,
+        workers=BROADCAST_WORKERS,
+        # Лимит Telegram общий для всех шардов
+        rate=BROADCAST_RATE / shards.count,
+        max_retries=BROADCAST_MAX_RETRIES
+    )
+    last_broadcaster = broadcaster
+    # Снимок списка пользователей: обработчики могут менять user_data во время рассылки
+    user_ids = user_data.keys()
+    await broadcaster.run(recipients(), render, total=len(user_ids), on_done=done)
+
 async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработчик глобальных ошибок"""
     logger.error(f"Необработанная ошибка: {context.error}")
@@ -541,6 +1485,316 @@ async def error_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
         except Exception as e:
             logger.error(f"Ошибка при отправке сообщения об ошибке: {e}")
 
+def parse_times(value: str) -> List[time]:
+    """Разбор списка времени вида '03:00,05:00' (UTC)"""
+    times = []
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            hour, minute = item.split(':')
+            times.append(time(hour=int(hour), minute=int(minute)))
+        except ValueError:
+            logger.error(f"Некорректное время '{item}' в расписании")
+    return times
+
+async def route_update(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Обновления пользователей других шардов передаются их экземплярам (группа -2, до остальных обработчиков)"""
+    user = update.effective_user
+    if user is None or shards.owns(user.id):
+        return
+    # Доставка идет в фоне по порядку обновлений пользователя и не держит его очередь (см. ShardRouter)
+    shard_router.forward(shards.shard_of(user.id), user.id, update.to_dict())
+    raise ApplicationHandlerStop
+
+async def load_user(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Загрузка данных пользователя вне event loop (группа -3, до остальных обработчиков)"""
+    if update.effective_user:
+        await user_data.preload(update.effective_user.id)
+
+async def track_activity(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Отметка активности пользователя (группа -1, выполняется перед остальными обработчиками)"""
+    if update.effective_user:
+        user_last_seen[update.effective_user.id] = time_module.monotonic()
+
+def _active_users_metric() -> Dict[Tuple[str, ...], float]:
+    cutoff = time_module.monotonic() - ACTIVE_USER_WINDOW
+    for user_id in [u for u, seen in user_last_seen.items() if seen < cutoff]:
+        del user_last_seen[user_id]
+    return {(): len(user_last_seen)}
+
+def _cache_metric(*field_names: str) -> Callable[[], Dict[Tuple[str, ...], float]]:
+    stats = bot.translation_cache.stats
+    if len(field_names) == 1:
+        return lambda: {(): getattr(stats, field_names[0])}
+    return lambda: {(name.split('_')[0],): getattr(stats, name) for name in field_names}
+
+def _broadcast_metric() -> Dict[Tuple[str, ...], float]:
+    if last_broadcaster is None:
+        return {}
+    stats = last_broadcaster.stats
+    return {
+        (name,): getattr(stats, name)
+        for name in ('total', 'sent', 'failed', 'blocked', 'skipped', 'retries', 'duration')
+    }
+
+def _update_processor_metric(application: Application) -> Callable[[], Dict[Tuple[str, ...], float]]:
+    processor = application.update_processor
+    return lambda: {
+        ('queued',): application.update_queue.qsize(),
+        ('waiting',): processor.waiting,
+        ('running',): processor.running,
+        ('users',): processor.active_keys,
+    }
+
+def register_metrics(application: Application):
+    """Метрики, значения которых собираются в момент запроса /metrics"""
+    metrics.gauge('bot_updates', 'Обновления: в очереди приложения, ждущие очереди пользователя или пула, '
+                  'выполняющиеся; пользователи с обновлениями в работе', ('state',),
+                  callback=_update_processor_metric(application))
+    metrics.counter('bot_updates_processed_total', 'Обработанные обновления',
+                    callback=lambda: {(): application.update_processor.processed})
+    metrics.counter('bot_updates_dropped_total', f'Обновления, отброшенные из-за очереди пользователя '
+                    f'длиннее {UPDATE_MAX_PER_USER}',
+                    callback=lambda: {(): application.update_processor.dropped})
+    debouncer = application.update_processor.debouncer
+    if debouncer is not None:
+        metrics.counter('bot_callbacks_dropped_total', 'Отброшенные повторные нажатия кнопок', ('reason',),
+                        callback=lambda: {(reason,): count for reason, count in debouncer.dropped.items()})
+    metrics.counter('bot_translation_cache_hits_total', 'Попадания в кэш переводов по уровню', ('tier',),
+                    callback=_cache_metric('memory_hits', 'disk_hits'))
+    metrics.counter('bot_translation_cache_misses_total', 'Промахи кэша переводов',
+                    callback=_cache_metric('misses'))
+    metrics.counter('bot_translation_cache_evictions_total', 'Вытеснения из кэша переводов в памяти',
+                    callback=_cache_metric('evictions'))
+    metrics.gauge('bot_translation_cache_hit_ratio', 'Доля попаданий в кэш переводов',
+                  callback=_cache_metric('hit_ratio'))
+    metrics.gauge('bot_translation_quota_chars', 'Суточный бюджет символов API перевода', ('state',),
+                  callback=lambda: {(name,): value for name, value in bot.translation_quota.as_dict().items()})
+    metrics.counter('bot_translation_quota_denied_total', 'Переводы, не выполненные из-за бюджета', ('priority',),
+                    callback=lambda: {(name,): count for name, count in bot.translation_quota.denied.items()})
+    metrics.gauge('bot_translation_waiting', 'Запросы перевода, ожидающие очереди к API', ('priority',),
+                  callback=lambda: {
+                      (name,): bot.translation_api.semaphore.waiting(priority) for priority, name in PRIORITY_NAMES.items()
+                  })
+    metrics.gauge('bot_translation_breaker_open', 'Источник перевода отключен предохранителем (1) или нет (0)',
+                  ('provider', 'state'),
+                  callback=lambda: {
+                      (name, state): int(state != 'closed') for name, state in bot.translator.breaker_states().items()
+                  })
+    metrics.counter('bot_translation_hedge_total', 'Хеджированные, деградировавшие к локальным данным '
+                    'и не получившие перевод к сроку запросы', ('outcome',),
+                    callback=lambda: {(name,): count for name, count in bot.translator.stats.items()})
+    metrics.counter('bot_translation_wins_total', 'Переводы по источнику, ответившему первым', ('provider',),
+                    callback=lambda: {(name,): count for name, count in bot.translator.wins.items()})
+    metrics.counter('bot_translation_batch_total', 'Объединение слов в запросы к API: запросы, слова в них '
+                    'и ответы, не разделившиеся по словам', ('provider', 'field'),
+                    callback=lambda: {
+                        (batcher.name, name): count
+                        for batcher in bot.translation_batchers for name, count in batcher.stats.items()
+                    })
+    metrics.gauge('bot_review_queue', 'Очередь повторений: пользователи с запланированным повторением '
+                  'и записи в куче вместе с устаревшими', ('state',),
+                  callback=lambda: {('users',): len(review_queue), ('entries',): review_queue.heap_size})
+    metrics.counter('bot_shard_forwarded_total', 'Обновления, переданные экземплярам других шардов '
+                    'и не доставленные после всех повторов', ('status',),
+                    callback=lambda: {
+                        (status,): shard_router.stats[status] for status in ('forwarded', 'failed')
+                    })
+    metrics.gauge('bot_shard_pending', 'Обновления в очередях пересылки другим шардам',
+                  callback=lambda: {(): shard_router.stats['pending']})
+    metrics.gauge('bot_users', 'Пользователи шарда: всего, загруженные в память и читаемые массовыми задачами',
+                  ('state',),
+                  callback=lambda: {
+                      ('known',): len(user_data), ('loaded',): user_data.loaded_count,
+                      ('streamed',): user_data.detached_count
+                  })
+    metrics.gauge('bot_user_cache_bytes', 'Оценка памяти загруженных пользователей и бюджет', ('field',),
+                  callback=lambda: {('used',): user_data.loaded_bytes, ('budget',): user_data.budget})
+    metrics.counter('bot_user_cache_total', 'Загрузки пользователей из хранилища, вытеснения из памяти '
+                    'и чтения массовыми задачами', ('event',),
+                    callback=lambda: {(event,): count for event, count in user_data.stats.items()})
+    metrics.gauge('bot_event_loop_lag_seconds', 'Задержка event loop: последний замер и максимум', ('field',),
+                  callback=lambda: {('last',): loop_monitor.last, ('max',): loop_monitor.max})
+    metrics.counter('bot_event_loop_stalls_total', f'Задержки event loop дольше {LOOP_LAG_THRESHOLD} с',
+                    callback=lambda: {(): loop_monitor.stalls})
+    metrics.gauge('bot_active_users', f'Пользователи, активные за последние {ACTIVE_USER_WINDOW} с',
+                  callback=_active_users_metric)
+    metrics.gauge('bot_broadcast', 'Прогресс текущей или последней рассылки', ('field',),
+                  callback=_broadcast_metric)
+
+def instrument_application(application: Application):
+    """Журнал медленных обработчиков, замер длительности и ошибок всех зарегистрированных обработчиков"""
+    for handlers in application.handlers.values():
+        for handler in handlers:
+            name = handler.callback.__name__
+            callback = traced(name, SLOW_REQUEST_THRESHOLD)(handler.callback)
+            handler.callback = timed(metrics, HANDLER_LATENCY, HANDLER_ERRORS, name)(callback)
+    if not metrics.enabled:
+        return
+    application.add_handler(TypeHandler(Update, track_activity), group=-1)
+    register_metrics(application)
+
+def instrument_job(callback: Callable) -> Callable:
+    """Замер длительности фоновой задачи"""
+    return timed(metrics, HANDLER_LATENCY, HANDLER_ERRORS, callback.__name__)(callback)
+
+async def on_startup(application: Application):
+    """Запуск фоновых задач и прогрев кэшей после инициализации приложения"""
+    user_data.start()
+    bot.translation_cache.start()
+    loop_monitor.start()
+    review_queue.load(await asyncio.to_thread(user_data.field_values, 'next_review'))
+    logger.info(f"Очередь повторений: {len(review_queue)} пользователей")
+    warmed = bot.translation_cache.warm()
+    logger.info(f"Кэш переводов прогрет: {warmed} записей")
+    bot.ready = True
+
+async def on_shutdown(application: Application):
+    """Сохранение несохраненных данных и закрытие ресурсов при остановке"""
+    bot.ready = False
+    await loop_monitor.stop()
+    await shard_router.close()
+    await user_data.close()
+    lease_store.close()
+    await bot.close_session()
+
+def build_application(request: Optional[BaseRequest] = None) -> Application:
+    """Создание приложения и регистрация обработчиков (request - замена Bot API, например в benchmark.py)"""
+    # Создание приложения
+    debounce_data = [data.strip() for data in CALLBACK_DEBOUNCE_DATA.split(',') if data.strip()]
+    debouncer = CallbackDebouncer(
+        debounce_data, window=CALLBACK_DEBOUNCE_WINDOW, loading_text="⏳ Уже загружаю слова..."
+    ) if debounce_data else None
+    builder = Application.builder().token(TOKEN).concurrent_updates(
+        KeyedUpdateProcessor(pool_size=UPDATE_CONCURRENCY, max_per_key=UPDATE_MAX_PER_USER, debouncer=debouncer)
+    )
+    # Время вызовов Bot API попадает в разбивку медленных обработчиков
+    builder = builder.request(TracedRequest(request or HTTPXRequest(connection_pool_size=256)))
+    if request is not None:
+        builder = builder.get_updates_request(request)
+    application = builder.build()
+    
+    # Регистрация обработчиков команд
+    application.add_handler(CommandHandler("start", start))
+    application.add_handler(CommandHandler("translate", translate_command))
+    application.add_handler(CommandHandler("more", more_command))
+    application.add_handler(CommandHandler("level", level_command))
+    application.add_handler(CommandHandler("stats", stats_command))
+    application.add_handler(CommandHandler("test_daily", test_daily_command))
+    application.add_handler(CommandHandler("review", review_command))
+    application.add_handler(CommandHandler("quota", quota_command))
+    application.add_handler(CommandHandler("profile", profile_command))
+    
+    # Обработчики callback-кнопок
+    application.add_handler(CallbackQueryHandler(handle_level_selection, pattern="^level_"))
+    application.add_handler(CallbackQueryHandler(handle_more_words, pattern="^more_words$"))
+    application.add_handler(CallbackQueryHandler(handle_translate_mode, pattern="^translate_mode$"))
+    application.add_handler(CallbackQueryHandler(handle_back_to_words, pattern="^back_to_words$"))
+    application.add_handler(CallbackQueryHandler(handle_change_level, pattern="^change_level$"))
+    application.add_handler(CallbackQueryHandler(handle_review, pattern="^review_"))
+    
+    # Inline-режим (включается командой /setinline у @BotFather)
+    application.add_handler(InlineQueryHandler(inline_query))
+    
+    # Обработчик текстовых сообщений
+    application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
+    
+    # Данные пользователя загружаются из хранилища до обработчиков, которые читают их синхронно
+    application.add_handler(TypeHandler(Update, load_user), group=-3)
+    
+    # Обработчик ошибок
+    application.add_error_handler(error_handler)
+    
+    # Метрики обработчиков
+    instrument_application(application)
+    
+    # Пересылка обновлений чужих пользователей при работе несколькими шардами. Регистрируется
+    # после инструментирования: ApplicationHandlerStop - исключение, но не ошибка обработчика
+    if shards.count > 1:
+        application.add_handler(TypeHandler(Update, route_update), group=-2)
+    
+    # Настройка ежедневной задачи (10:00 по Москве = 07:00 UTC)
+    try:
+        job_queue = application.job_queue
+        if job_queue:
+            job_queue.run_daily(
+                instrument_job(daily_words_job),
+                time=time(hour=7, minute=0),  # 10:00 МСК = 07:00 UTC
+                days=(0, 1, 2, 3, 4, 5, 6)   # Каждый день
+            )
+            for prepare_time in parse_times(DAILY_PREPARE_TIMES):
+                job_queue.run_daily(
+                    instrument_job(prepare_daily_words_job), time=prepare_time, data=prepare_time.strftime('%H:%M')
+                )
+            logger.info("Ежедневная задача настроена на 10:00 МСК")
+        else:
+            logger.warning("JobQueue недоступна - ежедневные уведомления отключены")
+    except Exception as e:
+        logger.error(f"Ошибка настройки JobQueue: {e}")
+        logger.info("Бот продолжит работу без автоматических уведомлений")
+    
+    return application
+
+async def run_application(application: Application):
+    """
+    Жизненный цикл бота в одном event loop: инициализация, приём обновлений
+    (polling или webhook), HTTP сервер проверок и плавная остановка по SIGTERM
+    """
+    webhook_mode = BOT_MODE == 'webhook'
+    if webhook_mode and not WEBHOOK_URL:
+        raise RuntimeError("Для режима webhook нужен WEBHOOK_URL")
+    if shards.count > 1 and len(SHARD_PEERS) != shards.count:
+        raise RuntimeError(f"Для {shards.count} шардов нужно {shards.count} адресов в SHARD_PEERS")
+    # Обновления от Telegram получает шард 0, остальные - пересланные им на webhook
+    receives_updates = shards.index == 0
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    server = BotServer(
+        application,
+        port=PORT,
+        is_ready=lambda: bot.ready and application.running,
+        webhook_path=WEBHOOK_PATH if webhook_mode or shards.count > 1 else None,
+        secret_token=WEBHOOK_SECRET,
+        metrics=metrics.render if metrics.enabled else None
+    )
+    await server.start()
+
+    await application.initialize()
+    try:
+        await on_startup(application)
+        await application.start()
+        if receives_updates and webhook_mode:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip('/') + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                drop_pending_updates=True
+            )
+        elif receives_updates:
+            await application.updater.start_polling(drop_pending_updates=True)
+        logger.info(f"Бот запущен! Режим: {BOT_MODE}, шард {shards.index + 1} из {shards.count}")
+
+        await stop_event.wait()
+        logger.info("Получен сигнал остановки, завершаю обработку обновлений")
+
+        # Новые обновления больше не принимаются, уже полученные дообрабатываются
+        server.draining = True
+        if application.updater and application.updater.running:
+            await application.updater.stop()
+        try:
+            await asyncio.wait_for(application.stop(), timeout=SHUTDOWN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Обработка обновлений не завершилась за {SHUTDOWN_TIMEOUT} с")
+    finally:
+        await server.stop()
+        await on_shutdown(application)
+        await application.shutdown()
+
 def main():
     """Запуск бота"""
     if not TOKEN:
@@ -548,58 +1802,13 @@ def main():
         return
     
     try:
-        # Создание приложения
-        application = Application.builder().token(TOKEN).build()
-        
-        # Регистрация обработчиков команд
-        application.add_handler(CommandHandler("start", start))
-        application.add_handler(CommandHandler("translate", translate_command))
-        application.add_handler(CommandHandler("more", more_command))
-        application.add_handler(CommandHandler("level", level_command))
-        application.add_handler(CommandHandler("stats", stats_command))
-        application.add_handler(CommandHandler("test_daily", test_daily_command))
-        
-        # Обработчики callback-кнопок
-        application.add_handler(CallbackQueryHandler(handle_level_selection, pattern="^level_"))
-        application.add_handler(CallbackQueryHandler(handle_more_words, pattern="^more_words$"))
-        application.add_handler(CallbackQueryHandler(handle_translate_mode, pattern="^translate_mode$"))
-        application.add_handler(CallbackQueryHandler(handle_back_to_words, pattern="^back_to_words$"))
-        application.add_handler(CallbackQueryHandler(handle_change_level, pattern="^change_level$"))
-        
-        # Обработчик текстовых сообщений
-        application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
-        
-        # Обработчик ошибок
-        application.add_error_handler(error_handler)
-        
-        # Настройка ежедневной задачи (10:00 по Москве = 07:00 UTC)
-        try:
-            job_queue = application.job_queue
-            if job_queue:
-                job_queue.run_daily(
-                    daily_words_job,
-                    time=time(hour=7, minute=0),  # 10:00 МСК = 07:00 UTC
-                    days=(0, 1, 2, 3, 4, 5, 6)   # Каждый день
-                )
-                logger.info("Ежедневная задача настроена на 10:00 МСК")
-            else:
-                logger.warning("JobQueue недоступна - ежедневные уведомления отключены")
-        except Exception as e:
-            logger.error(f"Ошибка настройки JobQueue: {e}")
-            logger.info("Бот продолжит работу без автоматических уведомлений")
-        
-        # Запуск бота
-        logger.info("Бот запущен!")
-        application.run_polling(drop_pending_updates=True)
-        
+        application = build_application()
+        asyncio.run(run_application(application))
     except KeyboardInterrupt:
         logger.info("Получен сигнал остановки")
     except Exception as e:
         logger.error(f"Критическая ошибка при запуске: {e}")
         raise
-    finally:
-        # Закрытие ресурсов
-        asyncio.run(bot.close_session())
 
 if __name__ == '__main__':
     main()
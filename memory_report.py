@@ -0,0 +1,80 @@
+"""
+Отчет о памяти на одного пользователя: старое представление UserData
+(множество строк и список словарей) против компактного (битовая карта и id,
+карточки повторения в array).
+
+Запуск:
+    python memory_report.py [--users 10000] [--learned 300]
+"""
+import argparse
+import gc
+import json
+import random
+import tracemalloc
+from array import array
+from typing import Callable, Dict, List
+
+from main import UserData, bot, word_index
+from word_index import WordSet
+
+
+def _legacy_user(words: List[str], translations: Dict[str, str], learned: int) -> Dict:
+    """Пользователь в прежнем формате: Set[str] и карточки слов целиком (строки общие)"""
+    return {
+        'level': 'B1',
+        'learned_words': set(random.sample(words, learned)),
+        'daily_words': [
+            {'word': word, 'definition': "-", 'translation': translations[word]}
+            for word in random.sample(words, 5)
+        ],
+        'last_daily_update': None
+    }
+
+
+def _compact_user(words: List[str], learned: int) -> UserData:
+    user = UserData(level='B1')
+    for word in random.sample(words, learned):
+        user.learned_words.add(word)
+        user.reviews.add(word_index.intern(word), 0)
+    user.daily_words = array('I', (word_index.intern(word) for word in random.sample(words, 5)))
+    return user
+
+
+def measure(factory: Callable, users: int) -> int:
+    """Байт на пользователя по данным tracemalloc"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    data = {user_id: factory() for user_id in range(users)}
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    total = sum(stat.size_diff for stat in after.compare_to(before, 'filename'))
+    del data
+    return total // users
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Память на одного пользователя")
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--learned', type=int, default=300)
+    args = parser.parse_args()
+
+    words = list(dict.fromkeys(word for level_words in bot.level_word_bank.values() for word in level_words))
+    translations = {word: f"перевод {word}" for word in words}
+    learned = min(args.learned, len(words))
+    random.seed(0)
+
+    report = {
+        'users': args.users,
+        'learned_words': learned,
+        'vocabulary': len(word_index),
+        'legacy_bytes_per_user': measure(lambda: _legacy_user(words, translations, learned), args.users),
+        'compact_bytes_per_user': measure(lambda: _compact_user(words, learned), args.users),
+        'learned_bitmap_bytes': WordSet(word_index, words[:learned]).nbytes(),
+        'review_deck_bytes': _compact_user(words, learned).reviews.nbytes(),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Поиск слов по началу для inline-режима: отсортированный массив ключей и bisect.
+
+Для коротких префиксов (1-2 символа), под которые попадает большая часть
+словаря, лучшие подсказки считаются заранее; более длинные префиксы дают
+короткий диапазон, который ранжируется при запросе.
+"""
+import bisect
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+class PrefixIndex:
+    """
+    Индекс пар (ключ, значение) по префиксу ключа.
+
+    rank задает порядок подсказок (меньше - выше), по умолчанию - порядок добавления.
+    """
+
+    def __init__(self, items: Iterable[Tuple[str, object]], rank: Optional[Callable[[int], tuple]] = None,
+                 precomputed_length: int = 2, limit: int = 50, scan_limit: int = 1000):
+        items = list(items)
+        entries = sorted((key, position) for position, (key, _) in enumerate(items) if key)
+        self.keys: List[str] = [key for key, _ in entries]
+        self._positions: List[int] = [position for _, position in entries]
+        self._values: List[object] = [value for _, value in items]
+        self._rank = rank or (lambda position: (position,))
+        self.limit = limit
+        self.scan_limit = scan_limit
+        self.precomputed_length = precomputed_length
+        self._top: Dict[str, List[int]] = {}
+        self._precompute()
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _range(self, prefix: str) -> Tuple[int, int]:
+        start = bisect.bisect_left(self.keys, prefix)
+        # '\U0010ffff' больше любого символа, поэтому граница захватывает все продолжения префикса
+        end = bisect.bisect_left(self.keys, prefix + '\U0010ffff', start)
+        return start, end
+
+    def _ranked(self, start: int, end: int, prefix: str) -> List[int]:
+        positions = self._positions[start:end]
+        keys = self.keys
+        # Точное совпадение первым, затем по rank, затем короче
+        order = sorted(
+            range(len(positions)),
+            key=lambda i: (keys[start + i] != prefix, self._rank(positions[i]), len(keys[start + i]))
+        )
+        return [positions[i] for i in order[:self.limit]]
+
+    def _precompute(self):
+        prefixes = {key[:length] for key in self.keys for length in range(1, self.precomputed_length + 1)}
+        for prefix in prefixes:
+            start, end = self._range(prefix)
+            self._top[prefix] = self._ranked(start, end, prefix)
+
+    def search(self, prefix: str, limit: Optional[int] = None) -> Sequence[object]:
+        """Значения с ключом, начинающимся с prefix, в порядке ранжирования"""
+        limit = min(limit or self.limit, self.limit)
+        if not prefix:
+            return []
+        top = self._top.get(prefix)
+        if top is None:
+            if len(prefix) <= self.precomputed_length:
+                return []
+            start, end = self._range(prefix)
+            if start == end:
+                return []
+            # Длинный префикс дает короткий диапазон; scan_limit страхует от вырожденных словарей
+            top = self._ranked(start, min(end, start + self.scan_limit), prefix)
+        return [self._values[position] for position in top[:limit]]
@@ -0,0 +1,208 @@
+"""
+Диагностика медленной работы без передеплоя.
+
+Trace накапливает время запроса по частям (ожидание очереди, запросы к
+источникам перевода, вызовы Bot API) в contextvar: обновление получает свой
+Trace в KeyedUpdateProcessor, задачи asyncio наследуют его. traced логирует
+обработчик или вызов дольше порога с разбивкой по частям. LoopLagMonitor
+замеряет задержку event loop, Profiler включает cProfile на заданное время.
+В простое все это стоит одного чтения contextvar и таймера раз в interval.
+"""
+import asyncio
+import contextvars
+import cProfile
+import functools
+import io
+import logging
+import pstats
+import time
+from typing import Any, Callable, Dict, Optional
+
+from telegram.request import BaseRequest, RequestData
+
+logger = logging.getLogger(__name__)
+
+# Части разбивки в порядке вывода
+QUEUE, UPSTREAM, TELEGRAM = 'queue', 'upstream', 'telegram'
+SPAN_LABELS = {QUEUE: 'очередь', UPSTREAM: 'перевод', TELEGRAM: 'Telegram'}
+
+
+class Trace:
+    """Время по частям внутри запроса; вложенный Trace передает время и родителю"""
+    __slots__ = ('spans', 'parent')
+
+    def __init__(self, parent: Optional['Trace'] = None):
+        self.spans: Dict[str, float] = {}
+        self.parent = parent
+
+    def add(self, name: str, seconds: float):
+        trace = self
+        while trace is not None:
+            trace.spans[name] = trace.spans.get(name, 0.0) + seconds
+            trace = trace.parent
+
+    def inherited(self, name: str) -> float:
+        """Время части, учтенное до начала вложенного Trace (например, очередь)"""
+        return self.parent.spans.get(name, 0.0) if self.parent is not None else 0.0
+
+
+current_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar('current_trace', default=None)
+
+
+def record(name: str, seconds: float):
+    """Учет времени части в текущем запросе, если он отслеживается"""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(name, seconds)
+
+
+def format_breakdown(total: float, spans: Dict[str, float]) -> str:
+    parts = [f"{SPAN_LABELS[name]} {spans[name]:.3f}" for name in SPAN_LABELS if spans.get(name)]
+    # Запросы перевода при хеджировании идут параллельно, поэтому остаток может быть отрицательным
+    other = total - sum(spans.get(name, 0.0) for name in SPAN_LABELS)
+    parts.append(f"прочее {max(0.0, other):.3f}")
+    return ', '.join(parts)
+
+
+def traced(name: str, threshold: float, describe: Optional[Callable[..., str]] = None) -> Callable:
+    """
+    Декоратор для корутин: предупреждение в лог, если вызов вместе с ожиданием
+    очереди занял больше threshold секунд (0 - без отслеживания).
+    describe(*args) уточняет вызов в логе.
+    """
+    def decorator(func: Callable) -> Callable:
+        if threshold <= 0:
+            return func
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            trace = Trace(current_trace.get())
+            token = current_trace.set(trace)
+            started = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                current_trace.reset(token)
+                spans = dict(trace.spans)
+                spans[QUEUE] = spans.get(QUEUE, 0.0) + trace.inherited(QUEUE)
+                total = time.perf_counter() - started + trace.inherited(QUEUE)
+                if total >= threshold:
+                    detail = f" ({describe(*args)})" if describe else ''
+                    logger.warning(f"Медленный вызов {name}{detail}: {total:.3f} с - {format_breakdown(total, spans)}")
+        return wrapper
+    return decorator
+
+
+class TracedRequest(BaseRequest):
+    """Обертка запросов к Bot API: время вызовов учитывается в разбивке запроса"""
+
+    def __init__(self, request: BaseRequest):
+        self.request = request
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self.request.read_timeout
+
+    async def initialize(self):
+        await self.request.initialize()
+
+    async def shutdown(self):
+        await self.request.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout: Any = BaseRequest.DEFAULT_NONE, write_timeout: Any = BaseRequest.DEFAULT_NONE,
+                         connect_timeout: Any = BaseRequest.DEFAULT_NONE,
+                         pool_timeout: Any = BaseRequest.DEFAULT_NONE):
+        started = time.perf_counter()
+        try:
+            return await self.request.do_request(
+                url, method, request_data, read_timeout=read_timeout, write_timeout=write_timeout,
+                connect_timeout=connect_timeout, pool_timeout=pool_timeout
+            )
+        finally:
+            record(TELEGRAM, time.perf_counter() - started)
+
+
+class LoopLagMonitor:
+    """
+    Задержка event loop: насколько позже ожидаемого просыпается задача со sleep(interval).
+    Задержка больше threshold означает, что какой-то код блокирует loop.
+    """
+
+    def __init__(self, interval: float = 0.5, threshold: float = 0.1,
+                 observer: Optional[Callable[[float], None]] = None):
+        self.interval = interval
+        self.threshold = threshold
+        self.observer = observer
+        self.last = 0.0
+        self.max = 0.0
+        self.stalls = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            self.last = lag
+            self.max = max(self.max, lag)
+            if self.observer is not None:
+                self.observer(lag)
+            if lag >= self.threshold:
+                self.stalls += 1
+                logger.warning(f"Event loop заблокирован на {lag:.3f} с")
+
+
+class Profiler:
+    """
+    cProfile потока event loop на заданное время; одновременно - один замер.
+    Место занимается синхронно через reserve, до первого await вызывающего.
+    """
+
+    def __init__(self):
+        self.running = False
+
+    def reserve(self) -> bool:
+        """Занять профилировщик для следующего profile; False, если замер уже идет"""
+        if self.running:
+            return False
+        self.running = True
+        return True
+
+    def release(self):
+        """Освободить место, если profile так и не был вызван"""
+        self.running = False
+
+    async def profile(self, seconds: float, limit: int = 40) -> str:
+        """Отчет pstats: функции по собственному и суммарному времени; место занимается через reserve"""
+        if not self.running:
+            raise RuntimeError("Профилировщик не занят через reserve")
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.disable()
+            self.running = False
+
+        output = io.StringIO()
+        stats = pstats.Stats(profiler, stream=output)
+        output.write(f"Профиль event loop за {seconds:g} с\n\n=== По собственному времени (tottime) ===\n")
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(limit)
+        output.write("\n=== По суммарному времени (cumtime) ===\n")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit)
+        return output.getvalue()
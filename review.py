@@ -0,0 +1,223 @@
+"""
+Интервальное повторение слов (SM-2) и общая очередь пользователей по сроку повторения.
+
+Карточки пользователя лежат в одном array('I') по 4 числа на слово, отсортированы
+по id слова: поиск - бинарный, ответ обновляет запись на месте. Сроки - номера
+дней (date.toordinal()), повторение планируется с точностью до дня.
+
+DueQueue - min-heap (срок, user_id) с ленивым удалением: ежедневная задача и
+/review получают пользователей, которым пора повторять, за O(log n) на
+пользователя, не перебирая всех.
+"""
+import heapq
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Оценки ответа (шкала SM-2)
+AGAIN, HARD, GOOD, EASY = 1, 3, 4, 5
+
+DEFAULT_EASE = 250  # фактор легкости * 100
+MIN_EASE = 130
+MAX_INTERVAL = 3650  # дней
+
+_FIELDS = 4
+_WORD, _DUE, _INTERVAL, _STATE = range(_FIELDS)
+
+
+def _pack_state(ease: int, reps: int, lapses: int) -> int:
+    return (ease << 16) | (min(reps, 255) << 8) | min(lapses, 255)
+
+
+def _unpack_state(state: int) -> Tuple[int, int, int]:
+    return state >> 16, (state >> 8) & 0xFF, state & 0xFF
+
+
+class ReviewCard:
+    """Снимок состояния карточки"""
+    __slots__ = ('word_id', 'due', 'interval', 'ease', 'reps', 'lapses')
+
+    def __init__(self, word_id: int, due: int, interval: int, ease: int, reps: int, lapses: int):
+        self.word_id = word_id
+        self.due = due
+        self.interval = interval
+        self.ease = ease
+        self.reps = reps
+        self.lapses = lapses
+
+
+class ReviewDeck:
+    """Карточки повторения одного пользователя: [word_id, срок, интервал, ease|reps|lapses] на слово"""
+    __slots__ = ('_records',)
+
+    def __init__(self):
+        self._records = array('I')
+
+    def __len__(self) -> int:
+        return len(self._records) // _FIELDS
+
+    def nbytes(self) -> int:
+        return self._records.buffer_info()[1] * self._records.itemsize
+
+    def _find(self, word_id: int) -> Tuple[int, bool]:
+        """Индекс записи и признак, что слово найдено (иначе - место для вставки)"""
+        records = self._records
+        low, high = 0, len(records) // _FIELDS
+        while low < high:
+            middle = (low + high) // 2
+            if records[middle * _FIELDS] < word_id:
+                low = middle + 1
+            else:
+                high = middle
+        found = low * _FIELDS < len(records) and records[low * _FIELDS] == word_id
+        return low, found
+
+    def __contains__(self, word_id: int) -> bool:
+        return self._find(word_id)[1]
+
+    def add(self, word_id: int, today: int, first_interval: int = 1) -> bool:
+        """Новое слово для повторения через first_interval дней; False, если оно уже есть"""
+        index, found = self._find(word_id)
+        if found:
+            return False
+        offset = index * _FIELDS
+        self._records[offset:offset] = array(
+            'I', (word_id, today + first_interval, 0, _pack_state(DEFAULT_EASE, 0, 0))
+        )
+        return True
+
+    def card(self, word_id: int) -> Optional[ReviewCard]:
+        index, found = self._find(word_id)
+        if not found:
+            return None
+        offset = index * _FIELDS
+        ease, reps, lapses = _unpack_state(self._records[offset + _STATE])
+        return ReviewCard(word_id, self._records[offset + _DUE], self._records[offset + _INTERVAL], ease, reps, lapses)
+
+    def answer(self, word_id: int, grade: int, today: int) -> Optional[ReviewCard]:
+        """
+        Обновление карточки по оценке SM-2 (1 - не помню ... 5 - легко).
+        Забытое слово возвращается завтра, интервал растет с фактором легкости.
+        """
+        index, found = self._find(word_id)
+        if not found:
+            return None
+        offset = index * _FIELDS
+        records = self._records
+        ease, reps, lapses = _unpack_state(records[offset + _STATE])
+        interval = records[offset + _INTERVAL]
+
+        if grade < HARD:
+            reps = 0
+            lapses += 1
+            interval = 1
+        else:
+            if reps == 0:
+                interval = 1
+            elif reps == 1:
+                interval = 6 if grade >= GOOD else 3
+            else:
+                interval = round(interval * ease / 100 * (1.3 if grade == EASY else 1.0))
+            reps += 1
+        penalty = 5 - grade
+        ease = max(MIN_EASE, ease + 10 - penalty * (8 + penalty * 2))
+        interval = max(1, min(interval, MAX_INTERVAL))
+
+        records[offset + _DUE] = today + interval
+        records[offset + _INTERVAL] = interval
+        records[offset + _STATE] = _pack_state(ease, reps, lapses)
+        return ReviewCard(word_id, today + interval, interval, ease, reps, lapses)
+
+    def due_words(self, today: int, limit: Optional[int] = None) -> List[int]:
+        """Id слов со сроком не позже today, самые просроченные первыми"""
+        records = self._records
+        due = [
+            (records[offset + _DUE], records[offset])
+            for offset in range(0, len(records), _FIELDS)
+            if records[offset + _DUE] <= today
+        ]
+        due.sort()
+        return [word_id for _, word_id in due[:limit]]
+
+    def due_count(self, today: int) -> int:
+        records = self._records
+        return sum(1 for offset in range(_DUE, len(records), _FIELDS) if records[offset] <= today)
+
+    def next_due(self) -> Optional[int]:
+        """Ближайший срок повторения"""
+        records = self._records
+        return min(records[_DUE::_FIELDS]) if records else None
+
+    def to_list(self, word: callable) -> List[list]:
+        """Сериализация: [слово, срок, интервал, ease, повторения, забывания]"""
+        records = self._records
+        result = []
+        for offset in range(0, len(records), _FIELDS):
+            ease, reps, lapses = _unpack_state(records[offset + _STATE])
+            result.append([
+                word(records[offset]), records[offset + _DUE], records[offset + _INTERVAL], ease, reps, lapses
+            ])
+        return result
+
+    @classmethod
+    def from_list(cls, items: Iterable[list], word_id: callable) -> 'ReviewDeck':
+        deck = cls()
+        rows = sorted(
+            (word_id(word), due, interval, _pack_state(ease, reps, lapses))
+            for word, due, interval, ease, reps, lapses in items
+        )
+        deck._records = array('I', (value for row in rows for value in row))
+        return deck
+
+
+class DueQueue:
+    """
+    Очередь пользователей по сроку повторения: min-heap с ленивым удалением.
+
+    schedule заменяет срок пользователя, старая запись в куче остается и
+    пропускается при извлечении; куча перестраивается, когда таких записей много.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[int, int]] = []
+        self._due: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._due)
+
+    @property
+    def heap_size(self) -> int:
+        return len(self._heap)
+
+    def due_of(self, user_id: int) -> Optional[int]:
+        return self._due.get(user_id)
+
+    def schedule(self, user_id: int, due: Optional[int]):
+        """Срок следующего повторения пользователя; None - повторять нечего"""
+        if due is None:
+            self._due.pop(user_id, None)
+            return
+        if self._due.get(user_id) == due:
+            return
+        self._due[user_id] = due
+        heapq.heappush(self._heap, (due, user_id))
+        if len(self._heap) > 2 * len(self._due) + 1024:
+            self._heap = [(due, user_id) for user_id, due in self._due.items()]
+            heapq.heapify(self._heap)
+
+    def pop_due(self, today: int) -> List[int]:
+        """Извлечение пользователей со сроком не позже today"""
+        users = []
+        heap = self._heap
+        while heap and heap[0][0] <= today:
+            due, user_id = heapq.heappop(heap)
+            if self._due.get(user_id) == due:
+                del self._due[user_id]
+                users.append(user_id)
+        return users
+
+    def load(self, items: Iterable[Tuple[int, int]]):
+        """Заполнение очереди при старте: пары (user_id, срок)"""
+        for user_id, due in items:
+            self._due[user_id] = due
+        self._heap = [(due, user_id) for user_id, due in self._due.items()]
+        heapq.heapify(self._heap)
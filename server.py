@@ -0,0 +1,82 @@
+import hmac
+import logging
+from typing import Callable, Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+
+class BotServer:
+    """
+    HTTP сервер бота на aiohttp: приём обновлений Telegram (webhook), проверки
+    состояния /healthz (процесс жив) и /readyz (бот готов принимать запросы),
+    метрики /metrics.
+    """
+
+    def __init__(self, application: Application, port: int, is_ready: Callable[[], bool],
+                 webhook_path: Optional[str] = None, secret_token: Optional[str] = None,
+                 metrics: Optional[Callable[[], str]] = None, host: str = '0.0.0.0'):
+        self.application = application
+        self.port = port
+        self.host = host
+        self.is_ready = is_ready
+        self.webhook_path = webhook_path
+        self.secret_token = secret_token
+        self.draining = False
+        self.metrics = metrics
+        self.app = web.Application()
+        self.app.router.add_get('/', self.handle_health)
+        self.app.router.add_get('/healthz', self.handle_health)
+        self.app.router.add_get('/readyz', self.handle_ready)
+        if metrics:
+            self.app.router.add_get('/metrics', self.handle_metrics)
+        if webhook_path:
+            self.app.router.add_post(webhook_path, self.handle_webhook)
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def handle_ready(self, request: web.Request) -> web.Response:
+        if self.draining or not self.is_ready():
+            return web.Response(status=503, text="not ready")
+        return web.Response(text="ready")
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.metrics(), content_type='text/plain', charset='utf-8',
+                            headers={'X-Content-Type-Options': 'nosniff'})
+
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        """Приём обновления от Telegram и постановка его в очередь приложения"""
+        if self.secret_token:
+            token = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+            if not hmac.compare_digest(token, self.secret_token):
+                return web.Response(status=403)
+        if self.draining:
+            # Telegram повторит доставку позже - обновление обработает другой экземпляр
+            return web.Response(status=503)
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except Exception as e:
+            logger.error(f"Некорректное обновление от Telegram: {e}")
+            return web.Response(status=400)
+
+        await self.application.update_queue.put(update)
+        return web.Response()
+
+    async def start(self):
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        logger.info(f"HTTP сервер запущен на порту {self.port}")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,279 @@
+"""
+Работа бота несколькими экземплярами (шардами).
+
+Пользователи делятся между SHARD_COUNT экземплярами по хэшу user_id: каждый
+загружает, меняет и рассылает только своих пользователей, поэтому данные
+одного пользователя пишет один процесс. Обновления чужих пользователей
+пересылаются экземпляру-владельцу на его webhook (ShardRouter).
+
+Ежедневные задачи выполняются под арендой в общем хранилище (LeaseStore):
+каждый шард за день рассылает один раз, даже если у шарда несколько реплик или
+экземпляр перезапустился после рассылки. Локально общим хранилищем служит
+файл SQLite, открытый несколькими процессами:
+
+    SHARD_COUNT=2 SHARD_INDEX=0 PORT=8080 SHARD_PEERS=http://127.0.0.1:8080,http://127.0.0.1:8081 \\
+        USER_STORE_DB=shared.sqlite3 python main.py
+    SHARD_COUNT=2 SHARD_INDEX=1 PORT=8081 SHARD_PEERS=... USER_STORE_DB=shared.sqlite3 python main.py
+"""
+import asyncio
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+class Sharding:
+    """Разбиение пользователей на count шардов; index - шард этого экземпляра"""
+
+    def __init__(self, index: int = 0, count: int = 1):
+        if count < 1 or not 0 <= index < count:
+            raise ValueError(f"Некорректный шард {index} из {count}")
+        self.index = index
+        self.count = count
+
+    def shard_of(self, user_id: int) -> int:
+        # crc32 одинаков во всех процессах и перемешивает подряд идущие id
+        return zlib.crc32(user_id.to_bytes(8, 'little', signed=True)) % self.count
+
+    def owns(self, user_id: int) -> bool:
+        return self.count == 1 or self.shard_of(user_id) == self.index
+
+
+def instance_id() -> str:
+    """Идентификатор процесса для аренды задач"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class LeaseStore:
+    """
+    Аренды задач по имени. Аренда продлевается тем же владельцем, переходит к
+    другому после истечения и больше не выдается после complete.
+    """
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        raise NotImplementedError
+
+    def complete(self, name: str, owner: str):
+        raise NotImplementedError
+
+    def release(self, name: str, owner: str):
+        """Досрочное освобождение, чтобы задачу мог повторить другой экземпляр"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryLeaseStore(LeaseStore):
+    """Аренды в памяти процесса: для одного экземпляра"""
+
+    def __init__(self):
+        # Имя -> [владелец, истекает, выполнена]
+        self._leases: Dict[str, List[Any]] = {}
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        lease = self._leases.get(name)
+        if lease is not None and (lease[2] or (lease[0] != owner and lease[1] > now)):
+            return False
+        self._leases[name] = [owner, now + ttl, False]
+        return True
+
+    def complete(self, name: str, owner: str):
+        lease = self._leases.get(name)
+        if lease is not None and lease[0] == owner:
+            lease[2] = True
+
+    def release(self, name: str, owner: str):
+        lease = self._leases.get(name)
+        if lease is not None and lease[0] == owner and not lease[2]:
+            del self._leases[name]
+
+
+class SQLiteLeaseStore(LeaseStore):
+    """Аренды в SQLite, общем для процессов одной машины (замена общей БД при локальном запуске)"""
+
+    # Выполненные аренды хранятся неделю, чтобы перезапуск не повторил задачу
+    RETENTION = 7 * 86400
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            " name TEXT PRIMARY KEY,"
+            " owner TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " done INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._db.commit()
+
+    def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        # Один upsert: проверка и захват атомарны между процессами
+        with self._lock:
+            with self._db:
+                cursor = self._db.execute(
+                    "INSERT INTO leases (name, owner, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                    "WHERE leases.done = 0 AND (leases.owner = excluded.owner OR leases.expires_at <= ?)",
+                    (name, owner, now + ttl, now)
+                )
+        return cursor.rowcount > 0
+
+    def complete(self, name: str, owner: str):
+        with self._lock:
+            with self._db:
+                self._db.execute("UPDATE leases SET done = 1 WHERE name = ? AND owner = ?", (name, owner))
+                self._db.execute("DELETE FROM leases WHERE expires_at < ?", (time.time() - self.RETENTION,))
+
+    def release(self, name: str, owner: str):
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    "DELETE FROM leases WHERE name = ? AND owner = ? AND done = 0", (name, owner)
+                )
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def create_lease_store(backend: str, path: str) -> LeaseStore:
+    """Хранилище аренд рядом с данными пользователей ('sqlite' или 'memory')"""
+    if backend == 'sqlite':
+        try:
+            return SQLiteLeaseStore(path)
+        except sqlite3.Error as e:
+            logger.error(f"Не удалось открыть хранилище аренд {path}: {e}")
+    logger.warning("Аренды задач хранятся только в памяти: несколько экземпляров повторят ежедневные задачи")
+    return MemoryLeaseStore()
+
+
+async def run_once(leases: LeaseStore, name: str, owner: str, ttl: float,
+                   job: Callable[[], Awaitable[None]]) -> bool:
+    """
+    Выполнение задачи под арендой name; False, если ее выполняет или уже
+    выполнил другой экземпляр. Аренда продлевается, пока задача работает;
+    при ошибке освобождается, чтобы задачу повторила другая реплика.
+    """
+    if not await asyncio.to_thread(leases.acquire, name, owner, ttl):
+        return False
+
+    async def renew():
+        while True:
+            await asyncio.sleep(ttl / 3)
+            if not await asyncio.to_thread(leases.acquire, name, owner, ttl):
+                logger.warning(f"Аренда {name} перехвачена другим экземпляром")
+                return
+
+    renewer = asyncio.create_task(renew())
+    try:
+        await job()
+    except BaseException:
+        await asyncio.to_thread(leases.release, name, owner)
+        raise
+    finally:
+        renewer.cancel()
+    await asyncio.to_thread(leases.complete, name, owner)
+    return True
+
+
+class ShardRouter:
+    """
+    Пересылка обновлений Telegram экземпляру шарда, которому принадлежит пользователь.
+
+    forward не ждет доставки: обновления ставятся в очередь пользователя, и
+    фоновая задача отправляет их по порядку. Каждый запрос ограничен своим
+    timeout, а не сессией переводов. Если экземпляр не принимает обновление,
+    попытки повторяются с растущей паузой (до attempts раз), следующие
+    обновления того же пользователя ждут, чтобы не обогнать его. Локально такие
+    обновления не обрабатываются: данные пользователя пишет только его шард.
+    """
+
+    def __init__(self, peers: List[str], path: str, get_session: Callable[[], Awaitable[aiohttp.ClientSession]],
+                 secret_token: Optional[str] = None, timeout: float = 2.0, attempts: int = 9,
+                 max_per_key: int = 100):
+        self.peers = peers
+        self.path = path
+        self.get_session = get_session
+        self.secret_token = secret_token
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.attempts = attempts
+        self.max_per_key = max_per_key
+        self.stats = {'forwarded': 0, 'pending': 0, 'failed': 0}
+        self._queues: Dict[int, Deque[Tuple[int, Dict[str, Any]]]] = {}
+        self._workers: Set[asyncio.Task] = set()
+
+    def forward(self, shard: int, key: int, data: Dict[str, Any]) -> bool:
+        """
+        Постановка обновления в очередь пересылки шарду (key - пользователь, его
+        обновления доставляются по порядку); False, если очередь пользователя переполнена
+        """
+        queue = self._queues.get(key)
+        if queue is None:
+            queue = self._queues[key] = deque()
+            task = asyncio.create_task(self._deliver(key, queue))
+            self._workers.add(task)
+            task.add_done_callback(self._workers.discard)
+        elif len(queue) >= self.max_per_key:
+            self.stats['failed'] += 1
+            logger.error(
+                f"Очередь пересылки пользователя {key} переполнена, обновление {data.get('update_id')} отброшено"
+            )
+            return False
+        queue.append((shard, data))
+        self.stats['pending'] += 1
+        return True
+
+    async def _deliver(self, key: int, queue: Deque[Tuple[int, Dict[str, Any]]]):
+        try:
+            while queue:
+                shard, data = queue[0]
+                try:
+                    if not await self._post(shard, data):
+                        self.stats['failed'] += 1
+                        logger.error(f"Обновление {data.get('update_id')} не доставлено шарду {shard}")
+                finally:
+                    queue.popleft()
+                    self.stats['pending'] -= 1
+        finally:
+            # Очередь удаляется в том же шаге loop, где опустела: forward создаст новую
+            self.stats['pending'] -= len(queue)
+            del self._queues[key]
+
+    async def _post(self, shard: int, data: Dict[str, Any]) -> bool:
+        url = self.peers[shard].rstrip('/') + self.path
+        headers = {'X-Telegram-Bot-Api-Secret-Token': self.secret_token} if self.secret_token else {}
+        session = await self.get_session()
+        for attempt in range(self.attempts):
+            try:
+                async with session.post(url, json=data, headers=headers, timeout=self.timeout) as response:
+                    if response.status == 200:
+                        self.stats['forwarded'] += 1
+                        return True
+                    logger.warning(f"Шард {shard} ответил {response.status} на пересылку обновления")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Шард {shard} недоступен: {e!r}")
+            if attempt + 1 < self.attempts:
+                await asyncio.sleep(min(60.0, 0.2 * 2 ** attempt))
+        return False
+
+    async def close(self):
+        """Отмена неотправленных пересылок при остановке"""
+        for task in list(self._workers):
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CacheStats:
+    """Счетчики работы кэша переводов"""
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    writes: int = 0
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        data = asdict(self)
+        data['hits'] = self.hits
+        data['hit_ratio'] = round(self.hit_ratio, 4)
+        return data
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация текста для ключа кэша: регистр и лишние пробелы"""
+    return ' '.join(text.split()).casefold()
+
+
+class TranslationCache:
+    """
+    Двухуровневый кэш переводов: LRU с TTL в памяти и SQLite на диске.
+
+    Ключ - пара (нормализованный текст, langpair). В кэш попадают только
+    реальные переводы, сообщения об ошибках сюда не передаются.
+
+    Записи на диск копятся и сохраняются одной транзакцией: фоновой задачей
+    (start) в отдельном потоке и через свое соединение, либо при close.
+    """
+
+    def __init__(self, db_path: Optional[str], max_size: int = 10000, ttl: float = 30 * 24 * 3600,
+                 flush_interval: float = 2.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.stats = CacheStats()
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[str, float]]" = OrderedDict()
+        # Переводы, еще не записанные на диск
+        self._unsaved: Dict[Tuple[str, str], Tuple[str, float]] = {}
+        self._write_lock = threading.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._db: Optional[sqlite3.Connection] = None
+        self._writer: Optional[sqlite3.Connection] = None
+        if db_path:
+            self._db = self._open_db(db_path)
+            if self._db is not None:
+                self._writer = sqlite3.connect(db_path, check_same_thread=False)
+
+    def _open_db(self, db_path: str) -> Optional[sqlite3.Connection]:
+        """Открытие дискового хранилища; при ошибке кэш работает только в памяти"""
+        try:
+            directory = os.path.dirname(db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            db = sqlite3.connect(db_path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS translations ("
+                " text TEXT NOT NULL,"
+                " langpair TEXT NOT NULL,"
+                " translation TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (text, langpair))"
+            )
+            db.commit()
+            return db
+        except sqlite3.Error as e:
+            logger.error(f"Не удалось открыть кэш переводов {db_path}: {e}")
+            return None
+
+    def get(self, text: str, langpair: str) -> Optional[str]:
+        """Поиск перевода сначала в памяти, затем на диске"""
+        key = (normalize_text(text), langpair)
+        now = time.time()
+
+        entry = self._memory.get(key)
+        if entry is not None:
+            translation, created_at = entry
+            if now - created_at < self.ttl:
+                self._memory.move_to_end(key)
+                self.stats.memory_hits += 1
+                return translation
+            # Устаревшая запись остается до вытеснения как запасной вариант для get_stale
+
+        entry = self._unsaved.get(key)
+        if entry is not None and now - entry[1] < self.ttl:
+            self._remember(key, *entry)
+            self.stats.memory_hits += 1
+            return entry[0]
+
+        if self._db is not None:
+            try:
+                row = self._db.execute(
+                    "SELECT translation, created_at FROM translations WHERE text = ? AND langpair = ?",
+                    key
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка чтения кэша переводов: {e}")
+                row = None
+            if row and now - row[1] < self.ttl:
+                self._remember(key, row[0], row[1])
+                self.stats.disk_hits += 1
+                return row[0]
+
+        self.stats.misses += 1
+        return None
+
+    def get_stale(self, text: str, langpair: str) -> Optional[str]:
+        """Перевод без учета TTL - запасной вариант, когда API недоступен; не влияет на статистику"""
+        key = (normalize_text(text), langpair)
+        entry = self._memory.get(key) or self._unsaved.get(key)
+        if entry is not None:
+            return entry[0]
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT translation FROM translations WHERE text = ? AND langpair = ?", key
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения кэша переводов: {e}")
+            return None
+        return row[0] if row else None
+
+    def set(self, text: str, langpair: str, translation: str):
+        """Сохранение перевода в память; на диск он попадает при следующем flush"""
+        key = (normalize_text(text), langpair)
+        now = time.time()
+        self._remember(key, translation, now)
+        self.stats.writes += 1
+        if self._writer is not None:
+            self._unsaved[key] = (translation, now)
+
+    def flush(self):
+        """Запись накопленных переводов на диск одной транзакцией; можно вызывать из другого потока"""
+        with self._write_lock:
+            if self._writer is None or not self._unsaved:
+                return
+            batch = self._unsaved
+            self._unsaved = {}
+            rows: List[Tuple[str, str, str, float]] = [
+                (text, langpair, translation, created_at)
+                for (text, langpair), (translation, created_at) in batch.items()
+            ]
+            try:
+                with self._writer:
+                    self._writer.executemany(
+                        "INSERT OR REPLACE INTO translations (text, langpair, translation, created_at) "
+                        "VALUES (?, ?, ?, ?)",
+                        rows
+                    )
+            except sqlite3.Error as e:
+                logger.error(f"Ошибка записи в кэш переводов: {e}")
+                # Более новые переводы тех же ключей, полученные во время записи, не затираются
+                for key, entry in batch.items():
+                    self._unsaved.setdefault(key, entry)
+
+    def start(self):
+        """Запуск фоновой записи на диск; вызывается из работающего event loop"""
+        if self._flush_task is None and self._writer is not None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.to_thread(self.flush)
+
+    def warm(self) -> int:
+        """Загрузка самых свежих записей с диска в память; возвращает их количество"""
+        if self._db is None:
+            return 0
+        try:
+            rows = self._db.execute(
+                "SELECT text, langpair, translation, created_at FROM translations "
+                "WHERE created_at > ? ORDER BY created_at DESC LIMIT ?",
+                (time.time() - self.ttl, self.max_size)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка чтения кэша переводов: {e}")
+            return 0
+        # Самые свежие записи добавляются последними, чтобы вытесняться позже
+        for text, langpair, translation, created_at in reversed(rows):
+            self._remember((text, langpair), translation, created_at)
+        return len(rows)
+
+    def _remember(self, key: Tuple[str, str], translation: str, created_at: float):
+        """Добавление записи в LRU с вытеснением самых старых"""
+        self._memory[key] = (translation, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+            self.stats.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._memory)
+
+    def close(self):
+        """Запись оставшихся переводов и закрытие дискового хранилища"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self.flush()
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,47 @@
+"""
+Настройки API перевода и создание его источников.
+
+Общие для бота (main.py) и сборки словаря (word_bank.py), чтобы сборка не
+импортировала main со всеми побочными эффектами.
+"""
+import os
+from typing import Awaitable, Callable, List, Optional
+
+import aiohttp
+
+from translation_providers import MyMemoryProvider
+from translation_quota import TranslationQuota
+
+TRANSLATION_API_URL = os.getenv('TRANSLATION_API_URL', 'https://api.mymemory.translated.net/get')
+TRANSLATION_TIMEOUT = 10  # секунд
+# Запасные MyMemory-совместимые сервисы через запятую, опрашиваются после основного
+TRANSLATION_FALLBACK_URLS = os.getenv('TRANSLATION_FALLBACK_URLS', '')
+TRANSLATION_CONCURRENCY = int(os.getenv('TRANSLATION_CONCURRENCY', '8'))
+TRANSLATION_CACHE_DB = os.getenv('TRANSLATION_CACHE_DB', 'translation_cache.sqlite3')
+TRANSLATION_CACHE_SIZE = int(os.getenv('TRANSLATION_CACHE_SIZE', '10000'))
+TRANSLATION_CACHE_TTL = int(os.getenv('TRANSLATION_CACHE_TTL', str(30 * 24 * 3600)))  # секунд
+# Суточный бюджет символов MyMemory (5000 анонимно, 50000 с email) и доля, оставляемая интерактивным запросам
+TRANSLATION_DAILY_CHARS = int(os.getenv('TRANSLATION_DAILY_CHARS', '5000'))
+TRANSLATION_QUOTA_WINDOW = int(os.getenv('TRANSLATION_QUOTA_WINDOW', '86400'))  # секунд
+TRANSLATION_BACKGROUND_RESERVE = float(os.getenv('TRANSLATION_BACKGROUND_RESERVE', '0.3'))
+
+
+def langpair(target_lang: str) -> str:
+    """Языковая пара для MyMemory API"""
+    return f'en|{target_lang}' if target_lang == 'ru' else 'ru|en'
+
+
+def create_session() -> aiohttp.ClientSession:
+    """HTTP сессия для запросов к API перевода"""
+    return aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=TRANSLATION_TIMEOUT))
+
+
+def create_providers(get_session: Callable[[], Awaitable],
+                     quota: Optional[TranslationQuota] = None) -> List[MyMemoryProvider]:
+    """Основной MyMemory с бюджетом quota и запасные сервисы из TRANSLATION_FALLBACK_URLS"""
+    providers = [MyMemoryProvider('mymemory', TRANSLATION_API_URL, get_session, TRANSLATION_CONCURRENCY, quota)]
+    providers.extend(
+        MyMemoryProvider(f"fallback{number}", url.strip(), get_session, TRANSLATION_CONCURRENCY)
+        for number, url in enumerate(TRANSLATION_FALLBACK_URLS.split(','), 1) if url.strip()
+    )
+    return providers
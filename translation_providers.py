@@ -0,0 +1,422 @@
+"""
+Источники перевода с предохранителями и хеджированием запросов.
+
+Каждый сетевой источник закрыт своим CircuitBreaker: после серии ошибок он
+на время исключается из работы и затем проверяется пробными запросами.
+HedgedTranslator опрашивает источники по порядку: если текущий не ответил за
+свой p95, параллельно запускается следующий (последним обычно стоит локальный
+словарь без сети). Ответ ждется не дольше deadline; опоздавшие переводы
+передаются в on_late_result, чтобы попасть в кэш. BatchingProvider собирает
+одновременные запросы отдельных слов в один запрос к источнику.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from translation_quota import INTERACTIVE, PRIORITY_NAMES, PrioritySemaphore, TranslationQuota
+
+logger = logging.getLogger(__name__)
+
+# Статусы, которые говорят о неисправности источника, а не о конкретном тексте
+FAILURE_STATUSES = frozenset(('timeout', 'error', 'quota'))
+
+
+def is_failure(status: str) -> bool:
+    return status in FAILURE_STATUSES or status.startswith('5')
+
+
+class TranslationProvider:
+    """Источник перевода: translate возвращает перевод (или None) и статус для метрик"""
+    name = ''
+    # Переводы из сети кэшируются, локальные и устаревшие - нет
+    cacheable = True
+
+    async def translate(self, text: str, langpair: str, priority: int = INTERACTIVE) -> Tuple[Optional[str], str]:
+        raise NotImplementedError
+
+
+class MyMemoryProvider(TranslationProvider):
+    """MyMemory API или совместимый с ним сервис, с бюджетом символов и ограничением параллельности"""
+
+    def __init__(self, name: str, url: str, get_session: Callable[[], Awaitable], concurrency: int,
+                 quota: Optional[TranslationQuota] = None):
+        self.name = name
+        self.url = url
+        self.get_session = get_session
+        self.semaphore = PrioritySemaphore(concurrency)
+        self.quota = quota
+
+    async def translate(self, text: str, langpair: str, priority: int = INTERACTIVE) -> Tuple[Optional[str], str]:
+        chars = len(text.strip())
+        if self.quota is not None and not self.quota.try_spend(chars, priority):
+            logger.warning(
+                f"Бюджет перевода исчерпан для {PRIORITY_NAMES[priority]} запроса: "
+                f"осталось {self.quota.remaining} символов"
+            )
+            return None, 'denied'
+
+        await self.semaphore.acquire(priority)
+        try:
+            translated, status = await self._call_api(text, langpair)
+        finally:
+            self.semaphore.release()
+
+        if self.quota is not None:
+            if status == 'quota':
+                self.quota.exhaust()
+            elif status in ('timeout', 'error') or status.startswith('5'):
+                # Запрос не дошел до API или не был выполнен - символы не израсходованы
+                self.quota.refund(chars)
+        return translated, status
+
+    async def _call_api(self, text: str, langpair: str) -> Tuple[Optional[str], str]:
+        try:
+            session = await self.get_session()
+            params = {
+                'q': text.strip(),
+                'langpair': langpair
+            }
+
+            async with session.get(self.url, params=params) as response:
+                if response.status == 200:
+                    data = await response.json()
+                    status = str(data.get('responseStatus', 200))
+                    translated = data.get('responseData', {}).get('translatedText', '')
+                    if status == '429' or 'ALL AVAILABLE FREE TRANSLATIONS' in translated:
+                        logger.warning(f"{self.name}: суточная квота API перевода исчерпана: {translated}")
+                        return None, 'quota'
+                    if status != '200' or translated.startswith('MYMEMORY WARNING'):
+                        logger.warning(f"{self.name}: API отказал в переводе '{text}': {status} {translated}")
+                        return None, 'rejected'
+                    return translated or None, '200'
+                elif response.status == 429:
+                    logger.warning(f"{self.name}: суточная квота API перевода исчерпана")
+                    return None, 'quota'
+                else:
+                    logger.warning(f"{self.name}: API вернул статус {response.status} для текста '{text}'")
+                    return None, str(response.status)
+
+        except asyncio.TimeoutError:
+            logger.error(f"{self.name}: таймаут при переводе текста '{text}'")
+            return None, 'timeout'
+        except Exception as e:
+            logger.error(f"{self.name}: ошибка при переводе '{text}': {e}")
+            return None, 'error'
+
+
+class LocalProvider(TranslationProvider):
+    """Перевод без сети: словари процесса и устаревшие записи кэша"""
+    cacheable = False
+
+    def __init__(self, name: str, lookup: Callable[[str, str], Optional[str]]):
+        self.name = name
+        self.lookup = lookup
+
+    async def translate(self, text: str, langpair: str, priority: int = INTERACTIVE) -> Tuple[Optional[str], str]:
+        translated = self.lookup(text, langpair)
+        return translated, 'local' if translated else 'miss'
+
+
+class BatchingProvider(TranslationProvider):
+    """
+    Объединение одновременных запросов отдельных слов в один запрос к источнику.
+
+    Слова копятся до max_items (или max_chars символов) либо window секунд и
+    отправляются одним текстом через перевод строки; ответ делится обратно по
+    строкам. Если число строк не совпало или строка пустая, слова переводятся
+    отдельными запросами. Фразы и тексты с пробелами идут в источник как есть.
+    """
+    DELIMITER = '\n'
+
+    def __init__(self, provider: TranslationProvider, max_items: int = 10, window: float = 0.01,
+                 max_chars: int = 450):
+        self.provider = provider
+        self.name = provider.name
+        self.cacheable = provider.cacheable
+        self.max_items = max_items
+        self.window = window
+        # MyMemory принимает до 500 байт в одном запросе
+        self.max_chars = max_chars
+        self._batches: Dict[Tuple[str, int], List[Tuple[str, asyncio.Future]]] = {}
+        self._timers: Dict[Tuple[str, int], asyncio.TimerHandle] = {}
+        self.stats: Dict[str, int] = {'requests': 0, 'words': 0, 'split_failed': 0}
+
+    def batchable(self, text: str) -> bool:
+        return self.max_items > 1 and 0 < len(text) < self.max_chars and not any(char.isspace() for char in text)
+
+    async def translate(self, text: str, langpair: str, priority: int = INTERACTIVE) -> Tuple[Optional[str], str]:
+        text = text.strip()
+        if not self.batchable(text):
+            return await self.provider.translate(text, langpair, priority)
+
+        key = (langpair, priority)
+        batch = self._batches.get(key)
+        if batch is not None and sum(len(word) + 1 for word, _ in batch) + len(text) > self.max_chars:
+            self._flush(key)
+            batch = None
+        if batch is None:
+            batch = self._batches[key] = []
+            self._timers[key] = asyncio.get_running_loop().call_later(self.window, self._flush, key)
+        future = asyncio.get_running_loop().create_future()
+        batch.append((text, future))
+        if len(batch) >= self.max_items:
+            self._flush(key)
+        # Отмена одного ожидающего не должна отменять перевод остальных слов пачки
+        return await asyncio.shield(future)
+
+    def _flush(self, key: Tuple[str, int]):
+        timer = self._timers.pop(key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._batches.pop(key, None)
+        if batch:
+            asyncio.ensure_future(self._send(batch, *key))
+
+    async def _send(self, batch: List[Tuple[str, asyncio.Future]], langpair: str, priority: int):
+        try:
+            if len(batch) == 1:
+                results = [await self.provider.translate(batch[0][0], langpair, priority)]
+            else:
+                results = await self._send_joined([word for word, _ in batch], langpair, priority)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        self.stats['requests'] += 1
+        self.stats['words'] += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _send_joined(self, words: List[str], langpair: str, priority: int) -> List[Tuple[Optional[str], str]]:
+        translated, status = await self.provider.translate(self.DELIMITER.join(words), langpair, priority)
+        if translated is None:
+            # Ошибку источника учитывает предохранитель одного запроса, а не каждого слова пачки
+            return [(None, status)] + [(None, 'batch')] * (len(words) - 1)
+        parts = [part.strip() for part in translated.split(self.DELIMITER)]
+        if len(parts) == len(words) and all(parts):
+            return [(part, status) for part in parts]
+
+        self.stats['split_failed'] += 1
+        logger.warning(f"{self.name}: ответ на пачку из {len(words)} слов не делится по строкам, перевожу по одному")
+        return await asyncio.gather(*(self.provider.translate(word, langpair, priority) for word in words))
+
+
+class CircuitBreaker:
+    """
+    Предохранитель по доле ошибок среди последних window вызовов.
+
+    closed -> open, когда доля ошибок достигает failure_rate (не раньше min_calls
+    вызовов); через open_seconds - half_open с half_open_probes пробными вызовами:
+    успех закрывает предохранитель, ошибка снова открывает.
+    """
+    CLOSED, HALF_OPEN, OPEN = 'closed', 'half_open', 'open'
+
+    def __init__(self, name: str, window: int = 20, failure_rate: float = 0.5, min_calls: int = 10,
+                 open_seconds: float = 30.0, half_open_probes: int = 1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.state = self.CLOSED
+        self.opened = 0
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probes = 0
+
+    def allow(self) -> bool:
+        """Можно ли сейчас обратиться к источнику; в half_open занимает пробный вызов"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.open_seconds:
+                return False
+            self.state = self.HALF_OPEN
+            self._probes = 0
+        if self.state == self.HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                return False
+            self._probes += 1
+        return True
+
+    def record(self, success: bool):
+        if self.state == self.OPEN:
+            # Вызов начат до отключения источника
+            return
+        if self.state == self.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+            if success:
+                self.state = self.CLOSED
+                self._outcomes.clear()
+            else:
+                self._open()
+            return
+        self._outcomes.append(success)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.failure_rate:
+            self._open()
+
+    def release(self):
+        """Вызов завершился без оценки источника (например, бюджет исчерпан)"""
+        if self.state == self.HALF_OPEN:
+            self._probes = max(0, self._probes - 1)
+
+    def _open(self):
+        self.state = self.OPEN
+        self.opened += 1
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        logger.warning(f"{self.name}: источник перевода отключен на {self.open_seconds:.0f} с")
+
+
+class Backend:
+    """Источник перевода в цепочке хеджирования"""
+    __slots__ = ('provider', 'breaker', 'latencies', '_hedge_delay', '_observed')
+
+    def __init__(self, provider: TranslationProvider, breaker: Optional[CircuitBreaker] = None):
+        self.provider = provider
+        self.breaker = breaker
+        # Длительность последних успешных ответов для оценки p95
+        self.latencies: Deque[float] = deque(maxlen=200)
+        self._hedge_delay: Optional[float] = None
+        self._observed = 0
+
+    @property
+    def name(self) -> str:
+        return self.provider.name
+
+    def observe(self, duration: float):
+        self.latencies.append(duration)
+        self._observed += 1
+        # Квантиль пересчитывается раз в 20 ответов, а не на каждый запрос
+        if self._observed % 20 == 0:
+            self._hedge_delay = None
+
+    def quantile(self, q: float) -> Optional[float]:
+        if len(self.latencies) < 20:
+            return None
+        if self._hedge_delay is None:
+            values = sorted(self.latencies)
+            self._hedge_delay = values[min(len(values) - 1, int(q * len(values)))]
+        return self._hedge_delay
+
+
+class HedgedTranslator:
+    """Перевод через цепочку источников с хеджированием и общим сроком ответа"""
+
+    def __init__(self, backends: List[Backend], hedge: bool = True, hedge_quantile: float = 0.95,
+                 min_hedge_delay: float = 0.05, max_hedge_delay: float = 1.0, deadline: float = 3.0,
+                 observer: Optional[Callable[[str, str, float], None]] = None,
+                 on_late_result: Optional[Callable[[str, str, str], None]] = None):
+        self.backends = backends
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.min_hedge_delay = min_hedge_delay
+        self.max_hedge_delay = max_hedge_delay
+        self.deadline = deadline
+        self.observer = observer
+        self.on_late_result = on_late_result
+        self.stats: Dict[str, int] = {'hedged': 0, 'degraded': 0, 'deadline': 0, 'unavailable': 0}
+        self.wins: Dict[str, int] = {backend.name: 0 for backend in backends}
+        self.skipped: Dict[str, int] = {backend.name: 0 for backend in backends}
+
+    def hedge_delay(self, backend: Backend) -> float:
+        """Сколько ждать источник, прежде чем запускать следующий"""
+        if not self.hedge:
+            return self.deadline
+        estimate = backend.quantile(self.hedge_quantile)
+        if estimate is None:
+            return self.max_hedge_delay
+        return min(self.max_hedge_delay, max(self.min_hedge_delay, estimate))
+
+    async def _call(self, backend: Backend, text: str, langpair: str, priority: int) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            translated, status = await backend.provider.translate(text, langpair, priority)
+        except asyncio.CancelledError:
+            if backend.breaker is not None:
+                backend.breaker.release()
+            raise
+        except Exception as e:
+            logger.error(f"{backend.name}: ошибка источника перевода: {e}")
+            translated, status = None, 'error'
+        duration = time.perf_counter() - started
+
+        if backend.breaker is not None:
+            if translated is not None:
+                backend.breaker.record(True)
+            elif is_failure(status):
+                backend.breaker.record(False)
+            else:
+                backend.breaker.release()
+        if translated is not None:
+            backend.observe(duration)
+        if self.observer is not None:
+            self.observer(backend.name, status, duration)
+        return translated
+
+    async def translate(self, text: str, langpair: str,
+                        priority: int = INTERACTIVE) -> Tuple[Optional[str], Optional[TranslationProvider]]:
+        """Первый полученный перевод и его источник; (None, None), если не получен к сроку"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        remaining_backends = iter(self.backends)
+        pending: Dict[asyncio.Task, Backend] = {}
+        launched = 0
+
+        def launch_next() -> Optional[Backend]:
+            nonlocal launched
+            for backend in remaining_backends:
+                if backend.breaker is not None and not backend.breaker.allow():
+                    self.skipped[backend.name] += 1
+                    continue
+                task = asyncio.ensure_future(self._call(backend, text, langpair, priority))
+                pending[task] = backend
+                launched += 1
+                if launched > 1:
+                    self.stats['hedged'] += 1
+                return backend
+            return None
+
+        current = launch_next()
+        while pending:
+            now = loop.time()
+            if now >= deadline:
+                self.stats['deadline'] += 1
+                break
+            timeout = min(self.hedge_delay(current), deadline - now) if current else deadline - now
+            done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                backend = pending.pop(task)
+                translated = task.result()
+                if translated is not None:
+                    self._leave_pending(pending, text, langpair)
+                    self.wins[backend.name] += 1
+                    if not backend.provider.cacheable:
+                        self.stats['degraded'] += 1
+                    return translated, backend.provider
+            # Текущий источник не ответил за свой p95 или ответил ошибкой - подключаем следующий;
+            # если источников не осталось, ждем начатые запросы до срока
+            current = launch_next()
+
+        self._leave_pending(pending, text, langpair)
+        self.stats['unavailable'] += 1
+        return None, None
+
+    def _leave_pending(self, pending: Dict[asyncio.Task, Backend], text: str, langpair: str):
+        """Незавершенные запросы продолжают работу, их переводы отдаются в on_late_result"""
+        if self.on_late_result is None:
+            return
+
+        def deliver(task: asyncio.Task):
+            if not task.cancelled() and task.result() is not None:
+                self.on_late_result(text, langpair, task.result())
+
+        for task, backend in pending.items():
+            if backend.provider.cacheable:
+                task.add_done_callback(deliver)
+
+    def breaker_states(self) -> Dict[str, str]:
+        return {backend.name: backend.breaker.state for backend in self.backends if backend.breaker is not None}
@@ -0,0 +1,122 @@
+"""
+Бюджет символов API перевода и приоритет интерактивных запросов над фоновыми.
+
+MyMemory ограничивает число переведенных символов в сутки на IP. Интерактивные
+запросы (ответы пользователям) расходуют весь бюджет, фоновые (подготовка и
+рассылка ежедневных слов) - только его часть сверх резерва; отказанные фоновые
+переводы добираются повторными проходами или в следующем окне.
+"""
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from typing import Dict, List, Optional, Tuple
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+
+# Приоритет текущей задачи; фоновые задачи выставляют BACKGROUND при старте
+translation_priority: contextvars.ContextVar[int] = contextvars.ContextVar(
+    'translation_priority', default=INTERACTIVE
+)
+
+
+class PrioritySemaphore:
+    """Семафор, который при освобождении пропускает ожидающих с меньшим priority первыми"""
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+    def waiting(self, priority: Optional[int] = None) -> int:
+        return sum(
+            1 for p, _, waiter in self._waiters
+            if not waiter.done() and (priority is None or p == priority)
+        )
+
+    async def acquire(self, priority: int = INTERACTIVE):
+        # release передает место ожидающему напрямую, поэтому при _value > 0 очереди нет
+        if self._value > 0:
+            self._value -= 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), waiter))
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            # Место уже передано этой задаче - отдаем его следующему
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._value += 1
+
+
+class TranslationQuota:
+    """
+    Учет символов в окне фиксированной длины (по умолчанию сутки UTC).
+
+    Символы списываются до запроса, чтобы одновременные запросы не превысили
+    бюджет; при отказе API по квоте бюджет считается исчерпанным до конца окна.
+    """
+
+    def __init__(self, limit: int, window: int = 86400, background_reserve: float = 0.3):
+        self.limit = limit
+        self.window = window
+        # Доля бюджета, недоступная фоновым задачам
+        self.background_reserve = background_reserve
+        self._window_start = self._current_window()
+        self.used = 0
+        self.exhausted = False
+        self.denied: Dict[str, int] = {name: 0 for name in PRIORITY_NAMES.values()}
+
+    def _current_window(self) -> float:
+        now = time.time()
+        return now - now % self.window
+
+    def _roll(self):
+        window_start = self._current_window()
+        if window_start != self._window_start:
+            self._window_start = window_start
+            self.used = 0
+            self.exhausted = False
+
+    @property
+    def remaining(self) -> int:
+        self._roll()
+        return 0 if self.exhausted else max(0, self.limit - self.used)
+
+    @property
+    def resets_in(self) -> float:
+        """Секунд до начала следующего окна"""
+        return self._window_start + self.window - time.time()
+
+    def try_spend(self, chars: int, priority: int = INTERACTIVE) -> bool:
+        """Списание символов; False если бюджета для этого приоритета не хватает"""
+        floor = self.limit * self.background_reserve if priority == BACKGROUND else 0
+        if self.remaining - chars < floor:
+            self.denied[PRIORITY_NAMES[priority]] += 1
+            return False
+        self.used += chars
+        return True
+
+    def refund(self, chars: int):
+        """Возврат символов запроса, который не дошел до API"""
+        self.used = max(0, self.used - chars)
+
+    def exhaust(self):
+        """API сообщил об исчерпании квоты"""
+        self._roll()
+        self.exhausted = True
+
+    def as_dict(self) -> Dict[str, float]:
+        return {'limit': self.limit, 'used': self.used, 'remaining': self.remaining}
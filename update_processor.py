@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Dict, Hashable, Iterable, Optional, Set, Tuple
+
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import BaseUpdateProcessor
+
+from profiling import QUEUE, Trace, current_trace
+
+logger = logging.getLogger(__name__)
+
+
+class _KeyLock:
+    """Блокировка ключа с числом обновлений, которые ее держат или ждут, и отброшенных сверх очереди"""
+    __slots__ = ('lock', 'users', 'dropped')
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+        self.dropped = 0
+
+
+class CallbackDebouncer:
+    """
+    Схлопывание повторных нажатий одной кнопки пользователем.
+
+    Пока нажатие (user_id, data) ждет или обрабатывается, повторные сразу получают
+    всплывающее уведомление loading_text и не выполняются; в течение window секунд
+    после принятого нажатия повторы отбрасываются с тем же ответом.
+    """
+
+    def __init__(self, callback_data: Iterable[str], window: float = 1.0,
+                 loading_text: str = "⏳ Загружаю..."):
+        self.callback_data = frozenset(callback_data)
+        self.window = window
+        self.loading_text = loading_text
+        self._in_flight: Set[Tuple[int, str]] = set()
+        self._accepted_at: Dict[Tuple[int, str], float] = {}
+        self.dropped: Dict[str, int] = {'in_flight': 0, 'debounced': 0}
+
+    def key(self, update: object) -> Optional[Tuple[int, str]]:
+        if isinstance(update, Update) and update.callback_query and update.callback_query.data in self.callback_data:
+            return update.callback_query.from_user.id, update.callback_query.data
+        return None
+
+    def claim(self, key: Tuple[int, str]) -> Optional[str]:
+        """Причина отбросить нажатие или None, если оно принято в работу"""
+        if key in self._in_flight:
+            return 'in_flight'
+        now = time.monotonic()
+        if now - self._accepted_at.get(key, float('-inf')) < self.window:
+            return 'debounced'
+        if len(self._accepted_at) >= 10000:
+            cutoff = now - self.window
+            self._accepted_at = {k: t for k, t in self._accepted_at.items() if t >= cutoff}
+        self._accepted_at[key] = now
+        self._in_flight.add(key)
+        return None
+
+    def release(self, key: Tuple[int, str]):
+        self._in_flight.discard(key)
+
+    async def reject(self, update: Update, reason: str):
+        self.dropped[reason] += 1
+        try:
+            await update.callback_query.answer(self.loading_text)
+        except TelegramError as e:
+            logger.debug(f"Не удалось ответить на повторное нажатие: {e}")
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """
+    Параллельная обработка обновлений с сохранением порядка для одного пользователя.
+
+    Обновления разных пользователей выполняются одновременно, не больше pool_size
+    сразу; обновления одного пользователя - строго по очереди, в порядке поступления,
+    и не занимают места в пуле, пока ждут предыдущее. У одного пользователя ждут не
+    больше max_per_key обновлений, следующие отбрасываются: иначе один пользователь
+    держал бы неограниченно много задач.
+
+    Приложение PTB 20.7 создает задачу на каждое обновление, не дожидаясь свободного
+    места, поэтому обработчик не замедляет получение обновлений. Семафор базового
+    класса берется до очереди пользователя, поэтому он не ограничен: иначе
+    обновления, ждущие своей очереди, занимали бы его места.
+    Повторные нажатия кнопок отсекаются debouncer до постановки в очередь пользователя.
+    Каждое обновление получает Trace (profiling.py) с временем ожидания очереди.
+    """
+
+    # Семафор базового класса: все ограничения - в очереди пользователя и пуле
+    UNBOUNDED = 2 ** 31 - 1
+
+    def __init__(self, pool_size: int = 16, max_per_key: int = 20,
+                 debouncer: Optional[CallbackDebouncer] = None):
+        super().__init__(max_concurrent_updates=self.UNBOUNDED)
+        self.pool_size = pool_size
+        self.max_per_key = max_per_key
+        self.debouncer = debouncer
+        self._pool = asyncio.Semaphore(pool_size)
+        self._key_locks: Dict[Hashable, _KeyLock] = {}
+        self.pending = 0
+        self.running = 0
+        self.processed = 0
+        self.dropped = 0
+
+    @staticmethod
+    def update_key(update: object) -> Optional[Hashable]:
+        """Ключ упорядочивания: пользователь, иначе чат"""
+        if isinstance(update, Update):
+            if update.effective_user:
+                return 'user', update.effective_user.id
+            if update.effective_chat:
+                return 'chat', update.effective_chat.id
+        return None
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        debounce_key = self.debouncer.key(update) if self.debouncer else None
+        if debounce_key is not None:
+            reason = self.debouncer.claim(debounce_key)
+            if reason is not None:
+                coroutine.close()
+                await self.debouncer.reject(update, reason)
+                return
+            try:
+                await self._process(update, coroutine)
+            finally:
+                self.debouncer.release(debounce_key)
+            return
+        await self._process(update, coroutine)
+
+    async def _process(self, update: object, coroutine: Awaitable[Any]):
+        key = self.update_key(update)
+        key_lock = self._key_locks.get(key) if key is not None else None
+        if key_lock is not None and key_lock.users >= self.max_per_key:
+            coroutine.close()
+            self.dropped += 1
+            key_lock.dropped += 1
+            if key_lock.dropped == 1:
+                logger.warning(f"Очередь {key} переполнена ({key_lock.users}), новые обновления отбрасываются")
+            return
+
+        self.pending += 1
+        received = time.perf_counter()
+        try:
+            if key is None:
+                await self._run(coroutine, received)
+                return
+
+            if key_lock is None:
+                key_lock = self._key_locks[key] = _KeyLock()
+            key_lock.users += 1
+            try:
+                # asyncio.Lock будит ожидающих в порядке очереди
+                async with key_lock.lock:
+                    await self._run(coroutine, received)
+            finally:
+                key_lock.users -= 1
+                if not key_lock.users:
+                    del self._key_locks[key]
+        finally:
+            self.pending -= 1
+            self.processed += 1
+
+    async def _run(self, coroutine: Awaitable[Any], received: float):
+        async with self._pool:
+            self.running += 1
+            trace = Trace()
+            trace.add(QUEUE, time.perf_counter() - received)
+            token = current_trace.set(trace)
+            try:
+                await coroutine
+            finally:
+                current_trace.reset(token)
+                self.running -= 1
+
+    @property
+    def waiting(self) -> int:
+        """Принятые обновления, которые ждут своей очереди или места в пуле"""
+        return self.pending - self.running
+
+    @property
+    def active_keys(self) -> int:
+        return len(self._key_locks)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
@@ -0,0 +1,448 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import (
+    Any, AsyncIterator, Callable, Dict, Generic, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+
+class UserStore:
+    """Интерфейс хранилища данных пользователей (записи - JSON-совместимые dict)"""
+
+    def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def load_many(self, user_ids: List[int]) -> List[Tuple[int, Dict[str, Any]]]:
+        """Записи найденных пользователей из списка"""
+        raise NotImplementedError
+
+    def save_many(self, records: List[Tuple[int, Dict[str, Any]]]):
+        raise NotImplementedError
+
+    def user_ids(self) -> List[int]:
+        raise NotImplementedError
+
+    def field_values(self, name: str) -> List[Tuple[int, Any]]:
+        """Значения поля верхнего уровня всех записей, где оно задано"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryUserStore(UserStore):
+    """Хранилище в памяти процесса: данные теряются при перезапуске"""
+
+    def __init__(self):
+        self._records: Dict[int, Dict[str, Any]] = {}
+
+    def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        return self._records.get(user_id)
+
+    def load_many(self, user_ids: List[int]) -> List[Tuple[int, Dict[str, Any]]]:
+        return [(user_id, self._records[user_id]) for user_id in user_ids if user_id in self._records]
+
+    def save_many(self, records: List[Tuple[int, Dict[str, Any]]]):
+        self._records.update(records)
+
+    def user_ids(self) -> List[int]:
+        return list(self._records)
+
+    def field_values(self, name: str) -> List[Tuple[int, Any]]:
+        return [
+            (user_id, record[name]) for user_id, record in self._records.items()
+            if record.get(name) is not None
+        ]
+
+
+class SQLiteUserStore(UserStore):
+    """
+    Хранилище в SQLite (WAL) для одного узла. Чтения идут через отдельное соединение
+    со своей блокировкой: в WAL они не ждут пакетную запись, которая держит писателя.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            " user_id INTEGER PRIMARY KEY,"
+            " data TEXT NOT NULL)"
+        )
+        self._db.commit()
+        self._read_lock = threading.Lock()
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+
+    def load(self, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._read_lock:
+            row = self._reader.execute("SELECT data FROM users WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def load_many(self, user_ids: List[int]) -> List[Tuple[int, Dict[str, Any]]]:
+        records = []
+        # Не больше 500 параметров в запросе (лимит SQLite - 999)
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            with self._read_lock:
+                rows = self._reader.execute(
+                    f"SELECT user_id, data FROM users WHERE user_id IN ({','.join('?' * len(chunk))})", chunk
+                ).fetchall()
+            records.extend((user_id, json.loads(data)) for user_id, data in rows)
+        return records
+
+    def save_many(self, records: List[Tuple[int, Dict[str, Any]]]):
+        rows = [(user_id, json.dumps(record, ensure_ascii=False)) for user_id, record in records]
+        with self._lock:
+            with self._db:
+                self._db.executemany(
+                    "INSERT INTO users (user_id, data) VALUES (?, ?) "
+                    "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data",
+                    rows
+                )
+
+    def user_ids(self) -> List[int]:
+        with self._read_lock:
+            return [row[0] for row in self._reader.execute("SELECT user_id FROM users")]
+
+    def field_values(self, name: str) -> List[Tuple[int, Any]]:
+        # json_extract читает поле без разбора записи в Python
+        with self._read_lock:
+            return self._reader.execute(
+                "SELECT user_id, json_extract(data, ?) FROM users WHERE json_extract(data, ?) IS NOT NULL",
+                (f'$.{name}', f'$.{name}')
+            ).fetchall()
+
+    def close(self):
+        with self._read_lock:
+            self._reader.close()
+        with self._lock:
+            self._db.close()
+
+
+def create_user_store(backend: str, path: str) -> UserStore:
+    """Создание хранилища по имени backend ('sqlite' или 'memory')"""
+    if backend == 'sqlite':
+        try:
+            return SQLiteUserStore(path)
+        except sqlite3.Error as e:
+            logger.error(f"Не удалось открыть хранилище пользователей {path}: {e}")
+    elif backend != 'memory':
+        logger.error(f"Неизвестное хранилище пользователей '{backend}'")
+    logger.warning("Данные пользователей хранятся только в памяти")
+    return MemoryUserStore()
+
+
+class _Resident:
+    """Пользователь в памяти: размер для бюджета и время последнего обращения"""
+    __slots__ = ('user', 'size', 'touched')
+
+    def __init__(self, user, size: int):
+        self.user = user
+        self.size = size
+        self.touched = time.monotonic()
+
+
+class UserRepository(Generic[T]):
+    """
+    Данные пользователей с ленивой загрузкой и отложенной пакетной записью.
+
+    Изменённые записи помечаются через mark_dirty и сбрасываются в хранилище
+    фоновой задачей пачками, запись выполняется в отдельном потоке, чтобы не
+    блокировать event loop. owns отбирает пользователей этого экземпляра, когда
+    хранилище общее для нескольких (см. sharding.py).
+
+    В памяти держатся недавно активные пользователи (LRU) в пределах budget байт
+    по оценке sizeof; сохраненные записи, к которым не обращались min_idle
+    секунд, вытесняются и при следующем get загружаются из хранилища (обработчики
+    обновлений загружают их заранее через preload, вне event loop). min_idle
+    защищает объекты, которые еще держат выполняющиеся обработчики. Массовые
+    задачи читают пользователей через stream, не вытесняя активных.
+    """
+
+    def __init__(self, store: UserStore, encode: Callable[[T], Dict[str, Any]],
+                 decode: Callable[[Dict[str, Any]], T],
+                 flush_interval: float = 2.0, batch_size: int = 500,
+                 owns: Optional[Callable[[int], bool]] = None,
+                 sizeof: Optional[Callable[[T], int]] = None, budget: int = 0, min_idle: float = 60.0):
+        self.store = store
+        self.owns = owns or (lambda user_id: True)
+        self.encode = encode
+        self.decode = decode
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.sizeof = sizeof or (lambda user: 1024)
+        # 0 - без ограничения
+        self.budget = budget
+        self.min_idle = min_idle
+        self.loaded_bytes = 0
+        self.stats: Dict[str, int] = {'loads': 0, 'evictions': 0, 'streamed': 0}
+        self._users: "OrderedDict[int, _Resident]" = OrderedDict()
+        # Пользователи, выданные stream и еще не возвращенные через release
+        self._detached: Dict[int, T] = {}
+        # Записи отпущенных пользователей, ожидающие сохранения
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        self._known_ids: Set[int] = set(filter(self.owns, store.user_ids()))
+        self._dirty: Set[int] = set()
+        # Пользователи, чья запись сейчас сохраняется: не вытесняются до ее завершения
+        self._saving: Set[int] = set()
+        self._flush_lock = asyncio.Lock()
+        self._flush_requested = asyncio.Event()
+        self._flush_task: Optional[asyncio.Task] = None
+
+    def get(self, user_id: int, default: Optional[T] = None) -> Optional[T]:
+        """Данные пользователя из памяти или хранилища"""
+        resident = self._users.get(user_id)
+        if resident is not None:
+            self._users.move_to_end(user_id)
+            resident.touched = time.monotonic()
+            size = self.sizeof(resident.user)
+            self.loaded_bytes += size - resident.size
+            resident.size = size
+            return resident.user
+        if user_id not in self._known_ids:
+            return default
+
+        # Пользователь, которого сейчас обрабатывает массовая задача, - тот же объект, теперь в LRU
+        user = self._detached.pop(user_id, None)
+        if user is None:
+            record = self._pending.pop(user_id, None)
+            if record is not None:
+                self._dirty.add(user_id)
+            else:
+                record = self.store.load(user_id)
+                if record is None:
+                    return default
+                self.stats['loads'] += 1
+            user = self.decode(record)
+        self._insert(user_id, user)
+        return user
+
+    async def preload(self, user_id: int):
+        """
+        Загрузка пользователя из хранилища в отдельном потоке, чтобы следующий get
+        нашел его в памяти и не читал хранилище в event loop
+        """
+        if (user_id in self._users or user_id in self._detached or user_id in self._pending
+                or user_id not in self._known_ids):
+            return
+        record = await asyncio.to_thread(self.store.load, user_id)
+        # Пока шло чтение, пользователя могли загрузить или выдать массовой задаче
+        if record is None or user_id in self._users or user_id in self._detached or user_id in self._pending:
+            return
+        self.stats['loads'] += 1
+        self._insert(user_id, self.decode(record))
+
+    def _insert(self, user_id: int, user: T):
+        resident = _Resident(user, self.sizeof(user))
+        previous = self._users.pop(user_id, None)
+        if previous is not None:
+            self.loaded_bytes -= previous.size
+        self._users[user_id] = resident
+        self.loaded_bytes += resident.size
+        self._evict()
+
+    def _evict(self):
+        """Вытеснение давно не активных сохраненных пользователей сверх бюджета"""
+        if not self.budget:
+            return
+        cutoff = time.monotonic() - self.min_idle
+        while self.loaded_bytes > self.budget and self._users:
+            user_id, resident = next(iter(self._users.items()))
+            if resident.touched > cutoff:
+                # Остальные обращались еще позже
+                return
+            if user_id in self._dirty or user_id in self._saving:
+                # Вытесняется после сохранения: иначе get загрузит из хранилища старую запись
+                self._flush_requested.set()
+                return
+            del self._users[user_id]
+            self.loaded_bytes -= resident.size
+            self.stats['evictions'] += 1
+
+    def __getitem__(self, user_id: int) -> T:
+        user = self.get(user_id)
+        if user is None:
+            raise KeyError(user_id)
+        return user
+
+    def __setitem__(self, user_id: int, user: T):
+        self._detached.pop(user_id, None)
+        self._pending.pop(user_id, None)
+        self._insert(user_id, user)
+        self._known_ids.add(user_id)
+        self.mark_dirty(user_id, user)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._known_ids
+
+    def __len__(self) -> int:
+        return len(self._known_ids)
+
+    def __iter__(self) -> Iterator[int]:
+        return iter(self.keys())
+
+    @property
+    def loaded_count(self) -> int:
+        """Количество пользователей, загруженных в память"""
+        return len(self._users)
+
+    @property
+    def detached_count(self) -> int:
+        """Пользователи, которых сейчас обрабатывают массовые задачи"""
+        return len(self._detached)
+
+    def keys(self) -> List[int]:
+        """Снимок id всех пользователей, включая не загруженных в память"""
+        return list(self._known_ids)
+
+    def items(self) -> Iterable[Tuple[int, T]]:
+        for user_id in self.keys():
+            user = self.get(user_id)
+            if user is not None:
+                yield user_id, user
+
+    async def stream(self, user_ids: Iterable[int], chunk_size: int = 500) -> AsyncIterator[Tuple[int, T]]:
+        """
+        Пользователи для массовой задачи: из памяти или пачками из хранилища, без
+        добавления в LRU. Каждого выданного пользователя нужно вернуть через release.
+        """
+        user_ids = list(user_ids)
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            # Объекты в памяти запоминаются до ожидания: пока читается хранилище и
+            # выдаются предыдущие пользователи, их могут вытеснить или отпустить
+            held: Dict[int, T] = {}
+            cold = []
+            for user_id in chunk:
+                resident = self._users.get(user_id)
+                user = resident.user if resident is not None else self._detached.get(user_id)
+                if user is not None:
+                    held[user_id] = user
+                elif user_id in self._known_ids and user_id not in self._pending:
+                    cold.append(user_id)
+            records = dict(await asyncio.to_thread(self.store.load_many, cold)) if cold else {}
+            self.stats['streamed'] += len(records)
+            for user_id in chunk:
+                resident = self._users.get(user_id)
+                if resident is not None:
+                    yield user_id, resident.user
+                    continue
+                user = self._detached.get(user_id)
+                if user is None:
+                    record = self._pending.pop(user_id, None)
+                    if record is not None:
+                        self._dirty.add(user_id)
+                        user = self.decode(record)
+                    elif user_id in held:
+                        # Вытеснен или отпущен без изменений - объект совпадает с хранилищем
+                        user = held[user_id]
+                    elif user_id in records:
+                        user = self.decode(records[user_id])
+                    else:
+                        continue
+                    self._detached[user_id] = user
+                yield user_id, user
+
+    def release(self, user_id: int):
+        """Массовая задача закончила с пользователем; изменения сохраняются без загрузки в LRU"""
+        user = self._detached.pop(user_id, None)
+        if user is not None and (user_id in self._dirty or user_id in self._saving):
+            # Запись, которая еще сохраняется, тоже остается в памяти до следующего сброса
+            self._dirty.discard(user_id)
+            self._pending[user_id] = self.encode(user)
+            self._flush_requested.set()
+
+    def field_values(self, name: str) -> List[Tuple[int, Any]]:
+        """Значения поля записей своих пользователей из хранилища"""
+        return [(user_id, value) for user_id, value in self.store.field_values(name) if self.owns(user_id)]
+
+    def mark_dirty(self, user_id: int, user: Optional[T] = None):
+        """
+        Пометить запись для сохранения. Пользователь, которого уже нет в памяти,
+        возвращается в LRU, если передан его объект, иначе - KeyError.
+        """
+        tracked = user_id in self._users or user_id in self._detached
+        if not tracked and user is None:
+            logger.error(f"Изменения пользователя {user_id} не сохранены: его нет в памяти")
+            raise KeyError(user_id)
+        # Помечается до вставки, чтобы _insert не вытеснил его снова
+        self._dirty.add(user_id)
+        if not tracked:
+            logger.warning(f"Пользователь {user_id} изменен после вытеснения, возвращается в память")
+            self._pending.pop(user_id, None)
+            self._insert(user_id, user)
+        if len(self._dirty) >= self.batch_size:
+            self._flush_requested.set()
+
+    def start(self):
+        """Запуск фоновой записи; вызывается из работающего event loop"""
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    async def flush(self):
+        """Сохранение всех изменённых записей"""
+        async with self._flush_lock:
+            while self._dirty or self._pending:
+                batch_ids = []
+                while self._dirty and len(batch_ids) < self.batch_size:
+                    batch_ids.append(self._dirty.pop())
+                # Сериализуем в event loop, чтобы получить согласованный снимок
+                records = []
+                for user_id in batch_ids:
+                    resident = self._users.get(user_id)
+                    user = resident.user if resident is not None else self._detached.get(user_id)
+                    if user is not None:
+                        records.append((user_id, self.encode(user)))
+                # Записи отпущенных пользователей остаются в _pending до конца сохранения,
+                # чтобы get и stream не прочитали из хранилища старую версию
+                pending = list(itertools.islice(self._pending.items(), self.batch_size - len(records)))
+                self._saving.update(batch_ids)
+                try:
+                    await asyncio.to_thread(self.store.save_many, records + pending)
+                except Exception as e:
+                    logger.error(f"Ошибка сохранения данных пользователей: {e}")
+                    self._dirty.update(batch_ids)
+                    return
+                finally:
+                    self._saving.difference_update(batch_ids)
+                for user_id, record in pending:
+                    # Запись, замененная во время сохранения, ждет следующего сброса
+                    if self._pending.get(user_id) is record:
+                        del self._pending[user_id]
+            self._evict()
+
+    async def close(self):
+        """Остановка фоновой записи, сохранение оставшихся изменений и закрытие хранилища"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        self.store.close()
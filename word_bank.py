@@ -0,0 +1,366 @@
+"""
+Компактный двуязычный словарь CEFR, загружаемый через mmap.
+
+Формат файла (little-endian):
+    заголовок      - magic, версия, число слов и уровней, sha1 исходного JSON,
+                     смещения секций
+    слова          - массив смещений (n + 1) и UTF-8 блок со словами
+    переводы       - массив смещений (n + 1) и UTF-8 блок с переводами
+    индекс         - id слов, отсортированные по слову (для бинарного поиска)
+    уровни         - таблица (название, начало, длина) и массив id слов
+
+Сборка:
+    python word_bank.py build [--words words_cefr.json] [--out words_cefr.bin] [--offline] [--allow-missing]
+                              [--max-chars N]
+
+Переводы берутся из кэша и API (настройки - translation_config.py); если часть
+слов осталась без перевода, сборка завершается ошибкой (см. --allow-missing).
+
+Сборка расходует ту же суточную квоту MyMemory, что и бот, если они работают с
+одного IP, а TranslationQuota бота об этом расходе не знает и после деплоя
+начинает счет с нуля. Поэтому запросы сборки к основному API ограничены
+WORD_BANK_BUILD_CHARS символами (--max-chars): остаток квоты остается боту,
+недополученные слова добираются следующими сборками из пополненного кэша.
+
+При деплое артефакт собирается командой сборки из railway.toml / railway.json с
+--allow-missing: недоступный API или исчерпанная квота не должны срывать деплой,
+а слова без перевода бот переводит во время работы через кэш и API. После
+изменения words_cefr.json артефакт пересобирается; устаревший (по sha1 исходного
+JSON) не загружается.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+from typing import Callable, Dict, Iterator, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'EWB1'
+VERSION = 1
+HEADER = struct.Struct('<4sHHII20s6I')
+LEVEL_ENTRY = struct.Struct('<4sII')
+UINT32 = struct.Struct('<I')
+# Попыток получить перевод слова при сборке
+BUILD_ATTEMPTS = 3
+# Символов основного API на одну сборку, чтобы деплой не израсходовал квоту бота
+BUILD_MAX_CHARS = int(os.getenv('WORD_BANK_BUILD_CHARS', '2000'))
+
+
+def file_digest(path: str) -> bytes:
+    """SHA-1 исходного файла для проверки актуальности артефакта"""
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).digest()
+
+
+def _pack_strings(strings: List[str]) -> bytes:
+    """Массив смещений и блок строк"""
+    blob = bytearray()
+    offsets = [0]
+    for value in strings:
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+    return struct.pack(f'<{len(offsets)}I', *offsets) + bytes(blob)
+
+
+def build_artifact(word_bank: Dict[str, List[str]], translations: Dict[str, str],
+                   out_path: str, source_digest: bytes = b'') -> int:
+    """
+    Запись артефакта на диск
+
+    Args:
+        word_bank: Слова по уровням, как в words_cefr.json
+        translations: Переводы слов (отсутствующие сохраняются пустыми)
+        out_path: Путь к файлу артефакта
+        source_digest: SHA-1 исходного JSON
+
+    Returns:
+        Количество уникальных слов
+    """
+    word_ids: Dict[str, int] = {}
+    words: List[str] = []
+    level_ids: Dict[str, List[int]] = {}
+    for level, level_words in word_bank.items():
+        ids = []
+        for word in level_words:
+            if word not in word_ids:
+                word_ids[word] = len(words)
+                words.append(word)
+            ids.append(word_ids[word])
+        level_ids[level] = ids
+
+    words_section = _pack_strings(words)
+    translations_section = _pack_strings([translations.get(word, '') for word in words])
+    sorted_ids = sorted(range(len(words)), key=lambda i: words[i])
+    index_section = struct.pack(f'<{len(sorted_ids)}I', *sorted_ids)
+
+    level_table = bytearray()
+    level_array: List[int] = []
+    for level, ids in level_ids.items():
+        level_table += LEVEL_ENTRY.pack(level.encode('ascii')[:4], len(level_array), len(ids))
+        level_array.extend(ids)
+    level_array_section = struct.pack(f'<{len(level_array)}I', *level_array)
+
+    sections = [words_section, translations_section, index_section, bytes(level_table), level_array_section]
+    positions = []
+    position = HEADER.size
+    for section in sections:
+        positions.append(position)
+        position += len(section)
+
+    header = HEADER.pack(
+        MAGIC, VERSION, 0, len(words), len(level_ids),
+        source_digest.ljust(20, b'\0')[:20], *positions, position
+    )
+    tmp_path = out_path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        for section in sections:
+            f.write(section)
+    os.replace(tmp_path, out_path)
+    return len(words)
+
+
+class _LevelWords(Sequence):
+    """Список слов уровня, читаемый прямо из mmap без копирования в память"""
+
+    def __init__(self, artifact: 'WordBankArtifact', start: int, count: int):
+        self._artifact = artifact
+        self._start = start
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self._count))]
+        if index < 0:
+            index += self._count
+        if not 0 <= index < self._count:
+            raise IndexError(index)
+        return self._artifact.word(self.word_id(index))
+
+    def word_id(self, index: int) -> int:
+        return self._artifact._level_word_id(self._start + index)
+
+
+class WordBankArtifact:
+    """Доступ к собранному словарю через mmap; страницы делятся между процессами"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, _, self.word_count, level_count, digest,
+             self._words_pos, self._translations_pos, self._index_pos,
+             self._levels_pos, self._level_ids_pos, self._end_pos) = HEADER.unpack_from(self._mmap, 0)
+            if magic != MAGIC or version != VERSION or self._end_pos != len(self._mmap):
+                raise ValueError(f"Некорректный формат файла {path}")
+        except Exception:
+            self._mmap.close()
+            raise
+        self.source_digest = digest
+        self._words_blob = self._words_pos + (self.word_count + 1) * UINT32.size
+        self._translations_blob = self._translations_pos + (self.word_count + 1) * UINT32.size
+
+        self.levels: Dict[str, _LevelWords] = {}
+        for i in range(level_count):
+            name, start, count = LEVEL_ENTRY.unpack_from(self._mmap, self._levels_pos + i * LEVEL_ENTRY.size)
+            level = name.rstrip(b'\0').decode('ascii')
+            self.levels[level] = _LevelWords(self, start, count)
+
+    def _string(self, table_pos: int, blob_pos: int, index: int) -> str:
+        start, = UINT32.unpack_from(self._mmap, table_pos + index * UINT32.size)
+        end, = UINT32.unpack_from(self._mmap, table_pos + (index + 1) * UINT32.size)
+        return self._mmap[blob_pos + start:blob_pos + end].decode('utf-8')
+
+    def _level_word_id(self, position: int) -> int:
+        return UINT32.unpack_from(self._mmap, self._level_ids_pos + position * UINT32.size)[0]
+
+    def word(self, word_id: int) -> str:
+        """Слово по id"""
+        return self._string(self._words_pos, self._words_blob, word_id)
+
+    def translation(self, word_id: int) -> Optional[str]:
+        """Перевод слова по id; None если перевод не был получен при сборке"""
+        return self._string(self._translations_pos, self._translations_blob, word_id) or None
+
+    def word_id(self, word: str) -> Optional[int]:
+        """Бинарный поиск id слова по отсортированному индексу"""
+        low, high = 0, self.word_count
+        while low < high:
+            middle = (low + high) // 2
+            candidate_id = UINT32.unpack_from(self._mmap, self._index_pos + middle * UINT32.size)[0]
+            candidate = self.word(candidate_id)
+            if candidate == word:
+                return candidate_id
+            if candidate < word:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def translate(self, word: str) -> Optional[str]:
+        """Перевод слова, если оно есть в словаре"""
+        word_id = self.word_id(word)
+        return self.translation(word_id) if word_id is not None else None
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.word(i) for i in range(self.word_count))
+
+    def __len__(self) -> int:
+        return self.word_count
+
+    def close(self):
+        self._mmap.close()
+
+
+def load_artifact(path: str, words_file: Optional[str] = None) -> Optional[WordBankArtifact]:
+    """Загрузка артефакта; None если его нет, он поврежден или устарел"""
+    if not path or not os.path.exists(path):
+        return None
+    try:
+        artifact = WordBankArtifact(path)
+    except Exception as e:
+        logger.error(f"Не удалось загрузить словарь {path}: {e}")
+        return None
+
+    if words_file and os.path.exists(words_file) and artifact.source_digest != file_digest(words_file):
+        logger.warning(f"Словарь {path} устарел относительно {words_file}, пересоберите его")
+        artifact.close()
+        return None
+    return artifact
+
+
+async def resolve_translations(words: List[str], resolver: Callable) -> Dict[str, str]:
+    """Получение переводов для всех слов через асинхронный resolver"""
+    results = await asyncio.gather(*(resolver(word) for word in words), return_exceptions=True)
+    translations = {}
+    for word, result in zip(words, results):
+        if isinstance(result, str) and result:
+            translations[word] = result
+        elif isinstance(result, BaseException):
+            logger.error(f"Ошибка при переводе '{word}': {result}")
+    return translations
+
+
+async def _fetch_translations(providers: List, cache, words: List[str]) -> Dict[str, str]:
+    """
+    Переводы из API для сборки: напрямую у источников, без срока ответа
+    интерактивного пути. Неудачные слова запрашиваются повторно.
+    """
+    from translation_config import langpair
+
+    pair = langpair('ru')
+    # Источники, исчерпавшие суточную квоту или бюджет сборки
+    exhausted = set()
+
+    async def fetch(word: str) -> Optional[str]:
+        for attempt in range(BUILD_ATTEMPTS):
+            if attempt:
+                await asyncio.sleep(2 ** attempt)
+            for provider in providers:
+                if provider.name in exhausted:
+                    continue
+                translated, status = await provider.translate(word, pair)
+                if translated:
+                    cache.set(word, pair, translated)
+                    return translated
+                if status in ('quota', 'denied'):
+                    exhausted.add(provider.name)
+            if len(exhausted) == len(providers):
+                return None
+        return None
+
+    return await resolve_translations(words, fetch)
+
+
+def _load_words(words_file: str) -> Dict[str, List[str]]:
+    try:
+        with open(words_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        raise SystemExit(f"Не удалось прочитать словарь {words_file}: {e}")
+
+
+async def _build(words_file: str, out_path: str, offline: bool, allow_missing: bool, max_chars: int):
+    from translation_cache import TranslationCache
+    from translation_config import (
+        TRANSLATION_CACHE_DB, TRANSLATION_CACHE_SIZE, TRANSLATION_CACHE_TTL, create_providers, create_session,
+        langpair
+    )
+    from translation_quota import TranslationQuota
+
+    word_bank = _load_words(words_file)
+    if not word_bank:
+        raise SystemExit(f"Словарь {words_file} пуст")
+
+    words = list(dict.fromkeys(word for level_words in word_bank.values() for word in level_words))
+    pair = langpair('ru')
+    cache = TranslationCache(TRANSLATION_CACHE_DB, TRANSLATION_CACHE_SIZE, TRANSLATION_CACHE_TTL)
+    session = None
+
+    async def get_session():
+        nonlocal session
+        if session is None:
+            session = create_session()
+        return session
+
+    # Бюджет сборки на всю квоту без резерва: фоновых запросов здесь нет
+    quota = TranslationQuota(max_chars, background_reserve=0.0)
+    try:
+        translations = {}
+        for word in words:
+            translated = cache.get(word, pair)
+            if translated:
+                translations[word] = translated
+
+        missing = [word for word in words if word not in translations]
+        if missing and not offline:
+            translations.update(await _fetch_translations(create_providers(get_session, quota), cache, missing))
+            missing = [word for word in words if word not in translations]
+            logger.info(f"Израсходовано символов основного API: {quota.used} из {max_chars}")
+    finally:
+        if session is not None:
+            await session.close()
+        cache.close()
+
+    if missing:
+        logger.error(
+            f"Без перевода {len(missing)} из {len(words)} слов, например: {', '.join(missing[:10])}"
+        )
+        # Непереведенные слова останутся в артефакте навсегда - без явного разрешения он не пишется
+        if not allow_missing:
+            raise SystemExit("Сборка прервана: повторите позже или укажите --allow-missing")
+
+    count = build_artifact(word_bank, translations, out_path, file_digest(words_file))
+    logger.info(f"Словарь {out_path} собран: {count} слов, переводов: {len(translations)}, без перевода: {len(missing)}")
+
+
+def main():
+    logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Сборка двуязычного словаря CEFR")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    build = subparsers.add_parser('build', help="собрать артефакт словаря")
+    build.add_argument('--words', default='words_cefr.json', help="исходный JSON со словами")
+    build.add_argument('--out', default='words_cefr.bin', help="путь к артефакту")
+    build.add_argument('--offline', action='store_true',
+                       help="не обращаться к API, использовать только кэш и встроенный словарь")
+    build.add_argument('--allow-missing', action='store_true',
+                       help="записать артефакт, даже если часть слов осталась без перевода")
+    build.add_argument('--max-chars', type=int, default=BUILD_MAX_CHARS,
+                       help="символов основного API на сборку (часть суточной квоты бота)")
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        asyncio.run(_build(args.words, args.out, args.offline, args.allow_missing, args.max_chars))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+import sys
+from typing import Dict, Iterable, Iterator, List, Optional
+
+
+class WordIndex:
+    """
+    Таблица интернирования слов: слово <-> целочисленный id.
+
+    Id назначаются в порядке первого появления слова в словаре CEFR (как и в
+    word_bank.py), слова вне словаря добавляются в конец по мере появления.
+    """
+
+    def __init__(self, words: Iterable[str] = ()):
+        self._ids: Dict[str, int] = {}
+        self._words: List[str] = []
+        self.extend(words)
+
+    def extend(self, words: Iterable[str]):
+        for word in words:
+            self.intern(word)
+
+    def intern(self, word: str) -> int:
+        """Id слова, при необходимости добавляет его в таблицу"""
+        word_id = self._ids.get(word)
+        if word_id is None:
+            word = sys.intern(word)
+            word_id = len(self._words)
+            self._ids[word] = word_id
+            self._words.append(word)
+        return word_id
+
+    def get_id(self, word: str) -> Optional[int]:
+        return self._ids.get(word)
+
+    def word(self, word_id: int) -> str:
+        return self._words[word_id]
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+
+class WordSet:
+    """Множество слов в виде битовой карты по id из WordIndex"""
+
+    __slots__ = ('_index', '_bits', '_count')
+
+    def __init__(self, index: WordIndex, words: Iterable[str] = ()):
+        self._index = index
+        self._bits = bytearray()
+        self._count = 0
+        for word in words:
+            self.add(word)
+
+    def add_id(self, word_id: int):
+        byte, bit = divmod(word_id, 8)
+        if byte >= len(self._bits):
+            self._bits.extend(bytes(byte + 1 - len(self._bits)))
+        mask = 1 << bit
+        if not self._bits[byte] & mask:
+            self._bits[byte] |= mask
+            self._count += 1
+
+    def add(self, word: str):
+        self.add_id(self._index.intern(word))
+
+    def contains_id(self, word_id: int) -> bool:
+        byte, bit = divmod(word_id, 8)
+        return byte < len(self._bits) and bool(self._bits[byte] & (1 << bit))
+
+    def __contains__(self, word: object) -> bool:
+        if not isinstance(word, str):
+            return False
+        word_id = self._index.get_id(word)
+        return word_id is not None and self.contains_id(word_id)
+
+    def ids(self) -> Iterator[int]:
+        for byte_index, byte in enumerate(self._bits):
+            if byte:
+                for bit in range(8):
+                    if byte & (1 << bit):
+                        yield byte_index * 8 + bit
+
+    def __iter__(self) -> Iterator[str]:
+        return (self._index.word(word_id) for word_id in self.ids())
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, WordSet):
+            return set(self.ids()) == set(other.ids())
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"WordSet({len(self)} слов)"
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self) + sys.getsizeof(self._bits)
@@ -0,0 +1,81 @@
+"""
+Выдача слов уровня без повторов: для каждого пользователя слова идут в порядке
+псевдослучайной перестановки, заданной seed, а позиция в ней хранится курсором.
+
+Перестановка вычисляется поэлементно (сеть Фейстеля с cycle-walking), поэтому
+ее не нужно хранить: на пользователя достаточно seed и курсора по каждому уровню.
+"""
+from typing import Callable, List, Tuple
+
+LEVELS = ('A1', 'A2', 'B1', 'B2', 'C1', 'C2')
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix(value: int) -> int:
+    """Перемешивание битов (финализатор splitmix64)"""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+class SeededPermutation:
+    """Биекция [0, n) -> [0, n), определяемая seed; i-й элемент вычисляется за O(1) в среднем"""
+
+    ROUNDS = 4
+
+    def __init__(self, size: int, seed: int):
+        self.size = size
+        half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+        self._half_bits = half_bits
+        self._half_mask = (1 << half_bits) - 1
+        self._keys = [_mix(seed * self.ROUNDS + i) for i in range(self.ROUNDS)]
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self._half_bits, value & self._half_mask
+        for key in self._keys:
+            left, right = right, left ^ (_mix(key ^ right) & self._half_mask)
+        return (left << self._half_bits) | right
+
+    def __getitem__(self, index: int) -> int:
+        if not 0 <= index < self.size:
+            raise IndexError(index)
+        # Домен сети Фейстеля меньше 4n, поэтому в среднем хватает нескольких шагов
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+    def __len__(self) -> int:
+        return self.size
+
+
+def level_position(level: str) -> int:
+    """Номер уровня в массиве курсоров"""
+    return LEVELS.index(level.upper())
+
+
+def draw_unseen(size: int, seed: int, cursor: int, count: int,
+                is_seen: Callable[[int], bool]) -> Tuple[List[int], int]:
+    """
+    Следующие count непросмотренных позиций перестановки
+
+    Args:
+        size: Количество слов уровня
+        seed: Seed перестановки пользователя для уровня
+        cursor: Текущая позиция в перестановке
+        count: Сколько слов нужно
+        is_seen: Проверка, что слово с данным индексом уже изучено
+
+    Returns:
+        Индексы слов в списке уровня и новый курсор; пустой список - уровень пройден
+    """
+    permutation = SeededPermutation(size, seed)
+    indexes = []
+    while cursor < size and len(indexes) < count:
+        index = permutation[cursor]
+        cursor += 1
+        if not is_seen(index):
+            indexes.append(index)
+    return indexes, cursor